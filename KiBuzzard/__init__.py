@@ -4,22 +4,13 @@ import subprocess
 import threading
 import time
 
-import wx
-import wx.aui
-from wx import FileConfig
-
-import os
-from .util import add_paths
-dir_path = os.path.dirname(os.path.realpath(__file__))
-paths = [
-    os.path.join(dir_path, 'deps'), 
-    os.path.join(dir_path, 'deps', 'fonttools', 'Lib'), 
-    os.path.join(dir_path, 'deps', 'svg2mod')
-]
+from .util import add_paths, paths
 
 def check_for_bom_button():
     # From Miles McCoo's blog
     # https://kicad.mmccoo.com/2017/03/05/adding-your-own-command-buttons-to-the-pcbnew-gui/
+    import wx
+
     def find_pcbnew_window():
         windows = wx.GetTopLevelWindows()
         pcbneww = [w for w in windows if "pcbnew" in w.GetTitle().lower()]
@@ -53,16 +44,19 @@ def check_for_bom_button():
 
 
 plugin = None
-try:
-    with add_paths(paths):
-        from .plugin import KiBuzzardPlugin
-    plugin = KiBuzzardPlugin()
-    plugin.register()
-except Exception as e:
-    print(e)
-    import logging
-    root = logging.getLogger()
-    root.debug(repr(e))
+# Only register the plugin when loaded by pcbnew, so the package can also
+# be imported headless (e.g. by KiBuzzard.batch) without wx or pcbnew.
+if 'pcbnew' in sys.modules:
+    try:
+        with add_paths(paths):
+            from .plugin import KiBuzzardPlugin
+        plugin = KiBuzzardPlugin()
+        plugin.register()
+    except Exception as e:
+        print(e)
+        import logging
+        root = logging.getLogger()
+        root.debug(repr(e))
 
 # Add a button the hacky way if plugin button is not supported
 # in pcbnew, unless this is linux.
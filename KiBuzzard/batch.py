@@ -0,0 +1,273 @@
+'''
+Headless batch generation of KiBuzzard labels.
+
+Reads a CSV or JSON list of label specs and writes one .kicad_mod
+footprint per label into a directory, which can be used directly as
+a KiCad footprint library when it is named *.pretty. No wx or pcbnew
+is required:
+
+    python -m KiBuzzard.batch labels.csv -o labels.pretty
+'''
+
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from .util import add_paths, paths
+
+with add_paths(paths):
+    from .buzzard.buzzard import Buzzard, EncodeParams
+    from svg2mod.coloredlogger import logger as svg2mod_logger
+    from svg2mod.coloredlogger import unfiltered_logger as svg2mod_unfiltered_logger
+
+logger = logging.getLogger(__name__)
+
+# Label spec fields, and the kb_params key each one sets
+spec_fields = {
+    'text': 'MultiLineText',
+    'font': 'FontComboBox',
+    'height': 'HeightCtrl',
+    'layer': 'LayerComboBox',
+    'cap_left': 'CapLeftChoice',
+    'cap_right': 'CapRightChoice',
+    'padding_top': 'PaddingTopCtrl',
+    'padding_left': 'PaddingLeftCtrl',
+    'padding_right': 'PaddingRightCtrl',
+    'padding_bottom': 'PaddingBottomCtrl',
+    'line_spacing': 'LineSpacingCtrl',
+    'width': 'WidthCtrl',
+    'alignment': 'AlignmentChoice',
+    'inline_format': 'inlineFormatTextbox',
+    'lineover_style': 'lineoverStyleChoice',
+    'lineover_thickness': 'lineoverThicknessCtrl',
+}
+
+# kb_params keys backed by a checkbox, all others are stored as strings
+bool_params = ['advancedCheckbox', 'inlineFormatTextbox']
+
+_buzzard = None
+
+#----------------------------------------------------------------------------
+
+def parse_bool(value):
+    '''Read a boolean from a JSON value or a CSV cell'''
+    if isinstance(value, str):
+        return value.strip().lower() in ['1', 'true', 'yes', 'y', 'on']
+    return bool(value)
+
+#----------------------------------------------------------------------------
+
+def spec_to_params(spec, defaults=None):
+    '''Convert a label spec into the kb_params dictionary stored
+    in the footprint, so labels can be edited later in the dialog.
+    Fields may be given by spec name (see spec_fields) or by
+    kb_params key. "padding" sets all four sides at once.
+    '''
+    params = dict(Buzzard.param_defaults)
+    params.update(defaults or {})
+
+    spec = {k: v for k, v in spec.items() if k is not None and v is not None and v != ''}
+    if 'padding' in spec:
+        padding = spec.pop('padding')
+        for side in ['top', 'left', 'right', 'bottom']:
+            spec.setdefault('padding_' + side, padding)
+
+    for field, value in spec.items():
+        if field == 'name':
+            continue
+        key = spec_fields.get(field, field)
+        if key not in Buzzard.param_defaults:
+            raise ValueError("Unknown label field '{}'".format(field))
+        params[key] = parse_bool(value) if key in bool_params else str(value)
+
+    if params['inlineFormatTextbox']:
+        params['advancedCheckbox'] = True
+
+    return params
+
+#----------------------------------------------------------------------------
+
+def read_specs(file_name):
+    '''Read label specs from a .json file (a list of objects)
+    or a .csv file (one label per row, fields as column names)
+    '''
+    if file_name.lower().endswith('.json'):
+        with open(file_name, 'r', encoding='utf-8') as f:
+            specs = json.load(f)
+        if not isinstance(specs, list):
+            raise ValueError("Expected a list of labels in '{}'".format(file_name))
+        return specs
+
+    with open(file_name, 'r', encoding='utf-8', newline='') as f:
+        return [dict(row) for row in csv.DictReader(f)]
+
+#----------------------------------------------------------------------------
+
+def footprint_name(spec, params):
+    '''Footprint name for a label. The name must contain "kibuzzard"
+    for the plugin to recognise the label when it is edited.
+    '''
+    name = spec.get('name') or re.sub(r'[^A-Za-z0-9_.+-]+', '_', params['MultiLineText']).strip('_')
+    if 'kibuzzard' not in name:
+        name = 'kibuzzard-' + name
+    return name
+
+#----------------------------------------------------------------------------
+
+def render_label(params, name):
+    '''Render a single label, returning the footprint as a string.
+    Each worker process keeps its own Buzzard, so fonts and rendered
+    text are reused between the labels it renders.
+    '''
+    global _buzzard
+    if _buzzard is None:
+        _buzzard = Buzzard()
+
+    if not _buzzard.configure(params):
+        raise ValueError("Label height must not be zero")
+    _buzzard.generate(params['MultiLineText'])
+    return _buzzard.create_v6_footprint(parm_text=EncodeParams(params), name=name)
+
+def _render_job(job):
+    name, params = job
+    try:
+        return name, render_label(params, name), None
+    except Exception as e:
+        return name, None, e
+
+def _init_worker(log_level):
+    svg2mod_logger.setLevel(log_level)
+
+#----------------------------------------------------------------------------
+
+def render_labels(job_list, jobs=None):
+    '''Render (name, params) jobs across a pool of `jobs` processes
+    (one per CPU by default). Returns a (name, footprint, error)
+    tuple per job, in order.
+    '''
+    if jobs == 1 or len(job_list) < 2:
+        return [_render_job(job) for job in job_list]
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+            initargs=(svg2mod_logger.level,)) as pool:
+        return list(pool.map(_render_job, job_list, chunksize=4))
+
+#----------------------------------------------------------------------------
+
+def generate_labels(specs, output_dir, defaults=None, jobs=None, overwrite=True):
+    '''Render all label specs into output_dir, one .kicad_mod per label.
+    Labels are rendered across a pool of `jobs` processes (one per CPU
+    by default). Returns the list of written file names and the
+    number of labels that failed to render.
+    '''
+    job_list = []
+    names = set()
+    for spec in specs:
+        params = spec_to_params(spec, defaults)
+        if params['MultiLineText'].strip() == '':
+            logger.warning("Skipping label without text: {}".format(spec))
+            continue
+
+        name = base = footprint_name(spec, params)
+        index = 2
+        while name in names:
+            name = "{}-{}".format(base, index)
+            index += 1
+        names.add(name)
+        job_list.append((name, params))
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = render_labels(job_list, jobs)
+
+    written = []
+    failed = 0
+    for name, footprint, error in results:
+        if error is not None:
+            logger.error("Failed to render '{}': {}".format(name, error))
+            failed += 1
+            continue
+
+        file_name = os.path.join(output_dir, name + '.kicad_mod')
+        if not overwrite and os.path.exists(file_name):
+            logger.warning("Not overwriting existing file: {}".format(file_name))
+            continue
+        with open(file_name, 'w', encoding='utf-8') as f:
+            f.write(footprint)
+        written.append(file_name)
+
+    return written, failed
+
+#----------------------------------------------------------------------------
+
+def get_arguments():
+    '''Return an instance of argparse.ArgumentParser and
+    the parsed args for the batch generator
+    '''
+    parser = argparse.ArgumentParser(
+        description='Generate KiBuzzard label footprints from a CSV or JSON list of labels.'
+    )
+
+    parser.add_argument('input_file_name', metavar='FILENAME',
+        help='CSV or JSON file describing the labels')
+
+    parser.add_argument('-o', '--output', dest='output_dir', metavar='DIR', default='kibuzzard.pretty',
+        help='Directory the .kicad_mod files are written to (default: kibuzzard.pretty)')
+
+    parser.add_argument('-j', '--jobs', type=int, metavar='N', default=None,
+        help='Number of worker processes (default: one per CPU)')
+
+    parser.add_argument('--font', dest='font', metavar='FONT',
+        help='Font for labels that do not set one')
+
+    parser.add_argument('--height', dest='height', metavar='MM',
+        help='Text height for labels that do not set one')
+
+    parser.add_argument('--layer', dest='layer', metavar='LAYER',
+        help='Layer for labels that do not set one')
+
+    parser.add_argument('--no-overwrite', dest='overwrite', action='store_false',
+        help='Keep existing footprint files')
+
+    parser.add_argument('-v', '--verbose', dest='verbose_print', action='store_true',
+        help='Print more verbose messages')
+
+    return parser.parse_args()
+
+#----------------------------------------------------------------------------
+
+def main():
+    args = get_arguments()
+
+    logging.basicConfig(format='%(levelname)s: %(message)s',
+        level=logging.INFO if args.verbose_print else logging.WARNING)
+    svg2mod_logger.setLevel(logging.INFO if args.verbose_print else logging.ERROR)
+    # svg2mod's loggers have their own handler, don't print everything twice
+    svg2mod_logger.propagate = False
+    svg2mod_unfiltered_logger.propagate = False
+
+    defaults = {}
+    for field in ['font', 'height', 'layer']:
+        if getattr(args, field) is not None:
+            defaults[spec_fields[field]] = getattr(args, field)
+
+    try:
+        specs = read_specs(args.input_file_name)
+        written, failed = generate_labels(specs, args.output_dir, defaults, args.jobs, args.overwrite)
+    except (OSError, ValueError) as e:
+        logger.error(e)
+        sys.exit(1)
+
+    logger.info("Wrote {} footprints to {}".format(len(written), args.output_dir))
+    if failed:
+        logger.error("{} labels failed to render".format(failed))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+'''
+Re-render every KiBuzzard label on a board.
+
+Labels are found by the kb_params keyword they store their settings in.
+Settings can be overridden for all of them at once (to change the house
+font, padding or layer), the labels are rendered across a pool of
+processes and then swapped in together, keeping the position, orientation
+and side of each label:
+
+    python -m KiBuzzard.bulk board.kicad_pcb --font UbuntuMono-B --padding 2
+
+or from the pcbnew scripting console:
+
+    from KiBuzzard.bulk import rerender_board
+    rerender_board(pcbnew.GetBoard(), {'font': 'UbuntuMono-B'})
+    pcbnew.Refresh()
+
+The pcbnew module is passed in to every function that needs it, so they
+can also be used with a stand-in for pcbnew.
+'''
+
+import argparse
+import logging
+import os
+import sys
+
+from .util import add_paths, paths
+from .batch import spec_fields, spec_to_params, render_labels
+
+with add_paths(paths):
+    from .buzzard.buzzard import DecodeParams
+    from svg2mod.coloredlogger import logger as svg2mod_logger
+    from svg2mod.coloredlogger import unfiltered_logger as svg2mod_unfiltered_logger
+
+logger = logging.getLogger(__name__)
+
+kb_params_prefix = 'kb_params='
+
+#----------------------------------------------------------------------------
+
+def find_labels(board):
+    '''Return (footprint, params) for every footprint on the board
+    that holds KiBuzzard label settings
+    '''
+    labels = []
+    for footprint in board.Footprints():
+        keywords = footprint.GetKeywords()
+        if not keywords.startswith(kb_params_prefix):
+            continue
+        try:
+            params = DecodeParams(keywords[len(kb_params_prefix):])
+        except ValueError as e:
+            logger.warning("Skipping {}, invalid kb_params: {}".format(footprint.GetReference(), e))
+            continue
+        labels.append((footprint, params))
+    return labels
+
+#----------------------------------------------------------------------------
+
+def parse_footprint(footprint_string, pcbnew):
+    '''Create a pcbnew footprint from the text of a .kicad_mod file'''
+    try:
+        io = pcbnew.PCB_PLUGIN()
+    except AttributeError:
+        io = pcbnew.PCB_IO_KICAD_SEXPR()
+    return pcbnew.Cast_to_FOOTPRINT(io.Parse(footprint_string))
+
+def replace_footprint(board, old_footprint, new_footprint, pcbnew):
+    '''Put new_footprint on the board in place of old_footprint, at the
+    same position and orientation and on the same side
+    '''
+    pos = old_footprint.GetPosition()
+    orient = old_footprint.GetOrientationDegrees()
+    wasOnBackLayer = old_footprint.GetLayer() == pcbnew.B_Cu
+
+    logger.debug("Replacing {} pos: {} orient: {} need_flip: {}".format(
+        old_footprint.GetReference(), pos, orient, wasOnBackLayer))
+
+    board.Add(new_footprint)
+    new_footprint.SetPosition(pos)
+    # Flip before setting orientation
+    if wasOnBackLayer:
+        new_footprint.Flip(pos, True)
+    new_footprint.SetOrientationDegrees(orient)
+
+    board.Remove(old_footprint)
+
+#----------------------------------------------------------------------------
+
+def in_process_only():
+    '''Embedded interpreters, like the one in pcbnew, can't start
+    worker processes because sys.executable isn't a python.
+    '''
+    return not os.path.basename(sys.executable or '').lower().startswith('python')
+
+def rerender_board(board, overrides=None, pcbnew=None, jobs=None):
+    '''Render every label on the board again, with the overrides
+    (label spec fields, see KiBuzzard.batch) applied to its settings.
+    Labels are only swapped once all of them rendered, so a failure
+    leaves the board unchanged. Returns the new footprints.
+    '''
+    if pcbnew is None:
+        import pcbnew
+
+    if jobs is None and in_process_only():
+        jobs = 1
+
+    labels = find_labels(board)
+    job_list = [(footprint.GetReference(), spec_to_params(overrides or {}, params))
+        for footprint, params in labels]
+
+    results = render_labels(job_list, jobs)
+    for name, footprint_string, error in results:
+        if error is not None:
+            raise ValueError("Failed to render '{}': {}".format(name, error))
+
+    new_footprints = [parse_footprint(footprint_string, pcbnew)
+        for _, footprint_string, _ in results]
+
+    for (old_footprint, _), new_footprint in zip(labels, new_footprints):
+        replace_footprint(board, old_footprint, new_footprint, pcbnew)
+
+    return new_footprints
+
+#----------------------------------------------------------------------------
+
+def get_arguments():
+    '''Return the parsed args for re-rendering the labels of a board'''
+    parser = argparse.ArgumentParser(
+        description='Render all KiBuzzard labels on a KiCad board again, optionally with changed settings.'
+    )
+
+    parser.add_argument('input_file_name', metavar='FILENAME',
+        help='KiCad board (.kicad_pcb)')
+
+    parser.add_argument('-o', '--output', dest='output_file_name', metavar='FILENAME', default=None,
+        help='Board file to write (default: overwrite the input)')
+
+    parser.add_argument('-j', '--jobs', type=int, metavar='N', default=None,
+        help='Number of worker processes (default: one per CPU)')
+
+    for field in ['font', 'height', 'layer', 'padding', 'cap_left', 'cap_right']:
+        parser.add_argument('--' + field.replace('_', '-'), dest=field, metavar='VALUE',
+            help='Set the {} of all labels'.format(field.replace('_', ' ')))
+
+    parser.add_argument('--set', dest='settings', metavar='FIELD=VALUE', action='append', default=[],
+        help='Set any label spec field or kb_params key of all labels, may be repeated')
+
+    parser.add_argument('-v', '--verbose', dest='verbose_print', action='store_true',
+        help='Print more verbose messages')
+
+    return parser.parse_args()
+
+#----------------------------------------------------------------------------
+
+def main():
+    args = get_arguments()
+
+    logging.basicConfig(format='%(levelname)s: %(message)s',
+        level=logging.INFO if args.verbose_print else logging.WARNING)
+    svg2mod_logger.setLevel(logging.INFO if args.verbose_print else logging.ERROR)
+    # svg2mod's loggers have their own handler, don't print everything twice
+    svg2mod_logger.propagate = False
+    svg2mod_unfiltered_logger.propagate = False
+
+    overrides = {}
+    for field in ['font', 'height', 'layer', 'padding', 'cap_left', 'cap_right']:
+        if getattr(args, field) is not None:
+            overrides[field] = getattr(args, field)
+    for setting in args.settings:
+        field, sep, value = setting.partition('=')
+        if not sep:
+            logger.error("Expected FIELD=VALUE, got '{}'".format(setting))
+            sys.exit(1)
+        overrides[field] = value
+
+    import pcbnew
+
+    try:
+        board = pcbnew.LoadBoard(args.input_file_name)
+        new_footprints = rerender_board(board, overrides, pcbnew, args.jobs)
+        pcbnew.SaveBoard(args.output_file_name or args.input_file_name, board)
+    except (OSError, ValueError) as e:
+        logger.error(e)
+        sys.exit(1)
+
+    logger.info("Rendered {} labels".format(len(new_footprints)))
+
+
+if __name__ == '__main__':
+    main()
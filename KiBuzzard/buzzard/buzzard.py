@@ -1,18 +1,86 @@
 # Original code from: https://github.com/sparkfunX/Buzzard
 import os
+import math
 import time
 import copy
 import re
-import wx
+import base64
+import json
+from collections import OrderedDict
 
 from fontTools.ttLib import ttFont
 from fontTools.pens.recordingPen import RecordingPen
 from fontTools.pens.basePen import decomposeQuadraticSegment
 
 from svg2mod import svg, svg2mod
-from svg2mod.exporter import Svg2ModExport, Svg2ModExportLatest, DEFAULT_DPI
+from svg2mod.exporter import Svg2ModExport, Svg2ModExportLatest, DEFAULT_DPI, DEFAULT_GRID
 from svg2mod.importer import Svg2ModImport
 
+def ParseFloat(InputString, DefaultValue=0.001):
+    value = DefaultValue
+    if InputString is not None and InputString != "":
+        try:
+            value = float(InputString)
+        except ValueError:
+            print("Value not valid")
+    return value
+
+def ParseInt(InputString, DefaultValue=0):
+    value = DefaultValue
+    if InputString is not None and InputString != "":
+        try:
+            value = int(InputString)
+        except ValueError:
+            print("Value not valid")
+    return value
+
+# Label settings are stored in the footprint keywords as "kb_params=<base64 json>"
+def EncodeParams(params):
+    json_str = json.dumps(params, sort_keys=True)
+    return base64.b64encode(json_str.encode('utf-8')).decode('ascii')
+
+def DecodeParams(encoded_str):
+    json_str = base64.b64decode(encoded_str).decode('utf-8')
+    return json.loads(json_str)
+
+# Fonts bundled with KiBuzzard, scanned once by LoadTypefaces()
+typeface_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'typeface')
+_typefaces = None
+
+def LoadTypefaces(reload=False):
+    global _typefaces
+    if _typefaces is None or reload:
+        _typefaces = {}
+        for entry in os.listdir(typeface_path):
+            entry_path = os.path.join(typeface_path, entry)
+
+            if not (entry_path.endswith('.ttf') or entry_path.endswith('.otf')):
+                continue
+
+            _typefaces[os.path.splitext(entry)[0]] = entry_path
+
+    # Make them available to svg2mod, this also stops it from indexing the system fonts
+    fnt_lib = svg.Text._system_fonts
+    for name, entry_path in _typefaces.items():
+        fnt_lib[name] = {'Path':entry_path}
+
+    return _typefaces
+
+# Inline markup, text in ~{} gets a lineover
+inline_markup = re.compile(r"(~{.*?})")
+
+# Stands in for the footprint name in footprints kept in the disk cache
+cache_name = "kibuzzard-CACHED-NAME"
+cache_tedit = re.compile(r"\(tedit [0-9A-F ]+\)")
+
+def polyBounds(polys):
+    # Bounds (xmin, ymin, xmax, ymax) of all points of the polygons, None without points
+    xs = [x for p in polys for x in p.data[0::2]]
+    ys = [y for p in polys for y in p.data[1::2]]
+    if not xs:
+        return None
+    return min(xs), min(ys), max(xs), max(ys)
+
 class Padding():
     def __init__(self):
         self.left = 0.001
@@ -22,6 +90,28 @@ class Padding():
 
 
 class Buzzard():
+
+    # Label settings, keyed by the name of the dialog control that edits them
+    param_defaults = {
+        'MultiLineText': 'KiBuzzard',
+        'HeightCtrl': '2',
+        'FontComboBox': 'UbuntuMono-B',
+        'LayerComboBox': 'F.Cu',
+        'CapLeftChoice': '[',
+        'CapRightChoice': ']',
+        'PaddingTopCtrl': '3.75',
+        'PaddingLeftCtrl': '3.75',
+        'PaddingRightCtrl': '3.75',
+        'PaddingBottomCtrl': '3.75',
+        'LineSpacingCtrl': '1.5',
+        'WidthCtrl': '',
+        'AlignmentChoice': 'Center',
+        'advancedCheckbox': False,
+        'inlineFormatTextbox': False,
+        'lineoverStyleChoice': 'Rounded',
+        'lineoverThicknessCtrl': '1'
+    }
+
     def __init__(self):
         self.fontName = 'FredokaOne'
         self.layer = 'F.Cu'
@@ -40,46 +130,223 @@ class Buzzard():
         self.lineOverThickness = 2
         self.lineOverStyle = 'Square'
         self.lineSpacing = 15
+        # Maximum deviation of curves in the footprint from the font outline, in mm
+        self.tolerance = 0.025
+        # Maximum deviation of the preview from the outline, in preview pixels
+        self.previewPixelTolerance = 0.5
+        # Memoize rendered lines and inline chunks between calls to generate
+        self.incremental = True
+        self.renderCacheSize = 256
+        self._renderCache = OrderedDict()
+        self._bboxCache = OrderedDict()
+        # Optional RenderCache that keeps finished labels between sessions
+        self.diskCache = None
+        self.params = dict(self.param_defaults)
+        self.text = None
+        self._cached = None
         #self.SystemFonts = svg.Text._system_fonts
 
         #svg.Text.load_system_fonts()
 
-        fnt_lib = svg.Text._system_fonts
-        if fnt_lib is None:
-            fnt_lib = {}
-
         # Load included fonts 
-        typeface_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'typeface')
-        for entry in os.listdir(typeface_path):
-            entry_path = os.path.join(typeface_path, entry)
-            
-            if not (entry_path.endswith('.ttf') or entry_path.endswith('.otf')):
-                continue
+        LoadTypefaces()
 
-            fnt_lib[os.path.splitext(os.path.basename(entry_path))[0]] = {'Path':entry_path}
+    def typefaces(self):
+        return list(LoadTypefaces().keys())
 
-    def generate(self, inString):
-        self.svgText = self.renderLabel(inString)
-        self.svgText.style['fill'] = True
-        
-        mod = Svg2Points(Svg2ModImport(), precision=1.0, scale_factor=1.0, center=True)
-        mod.add_svg_element(self.svgText)
-        mod.write()
+    # ******************************************************************************
+    #
+    # Apply label settings, as edited in the dialog and stored in kb_params
+    #
+    #   Missing settings fall back to param_defaults. Returns False if the
+    #   requested height is zero, in which case the label can't be scaled.
+    #
+    def configure(self, params):
+        settings = dict(self.param_defaults)
+        settings.update({k: v for k, v in params.items() if v is not None})
+        self.params = settings
+
+        self.fontName = settings['FontComboBox']
+        self.lineSpacing = ParseFloat(settings['LineSpacingCtrl']) * 10
+
+        requestedHeight = ParseFloat(settings['HeightCtrl'])
+
+        # When editing the text height field. If the value is null, avoid a divide by 0 exception
+        if requestedHeight == 0:
+            return False
+
+        self.padding.top = ParseFloat(settings['PaddingTopCtrl'])
+        self.padding.left = ParseFloat(settings['PaddingLeftCtrl'])
+        self.padding.right = ParseFloat(settings['PaddingRightCtrl'])
+        self.padding.bottom = ParseFloat(settings['PaddingBottomCtrl'])
+
+        # Padding is updated in realtime, so make sure it stays positive
+        for attr in ['left', 'right', 'top', 'bottom']:
+            if getattr(self.padding, attr) <= 0: setattr(self.padding, attr, 0.001)
+
+        self.layer = settings['LayerComboBox']
+
+        self.alignment = settings['AlignmentChoice']
+        # KiBuzzard aims to size uppercase letters at the height requested.
+        # Font size include space below the baseline and above the "caps height" for larger glyphs like `[]`
+        # All fonts are slightly different. So we render a 'H' to determine the scale of the selected font.
+        text_height = self.text_height()
+
+        # Scale font and apply DPI
+        self.scaleFactor = (requestedHeight/text_height) * (96/25.4)
+        self.width = ParseFloat(settings['WidthCtrl'], 0.0) * (96/25.4) * 1/self.scaleFactor
+
+        styles = {'':'', '(':'round', '[':'square', '<':'pointer', '/':'fslash', '\\':'bslash', '>':'flagtail'}
+        self.leftCap = styles[settings['CapLeftChoice']]
+
+        styles = {'':'', ')':'round', ']':'square', '>':'pointer', '/':'fslash', '\\':'bslash', '<':'flagtail'}
+        self.rightCap = styles[settings['CapRightChoice']]
+
+        self.inlineFormat = bool(settings['inlineFormatTextbox'])
+
+        self.lineOverThickness = ParseInt(settings['lineoverThicknessCtrl'], DefaultValue=1)
+
+        self.lineOverStyle = settings['lineoverStyleChoice']
+
+        return True
+
+    # ******************************************************************************
+    #
+    # Render the label and return its outline as polygons for the preview
+    #
+    #   previewSize is the (width, height) in pixels of the preview the label is
+    #   scaled to fit. When given, curves are only flattened as finely as that
+    #   preview can show. The footprint is always made at full precision.
+    #
+    def generate(self, inString, previewSize=None):
+        self.text = inString
+
+        # Labels found in the disk cache are returned without rendering
+        key = self.diskCacheKey()
+        entry = self.diskCache.get(key) if key is not None else None
+        if entry is not None:
+            polys = [svg.PointArray.from_coords(c[0::2], c[1::2]) for c in entry['polys']]
+            tolerance = self.previewTolerance(polyBounds(polys), previewSize)
+            cached_tolerance = entry.get('preview_tolerance')
+            if cached_tolerance is None or (tolerance is not None and cached_tolerance <= tolerance):
+                # Rendered only when a footprint that isn't cached is needed
+                self.svgText = None
+                self._cached = (key, entry, polys, cached_tolerance)
+                return polys
+
+        self.svgText = self.renderSvgText(inString)
+
+        bbox = self.svgText.bbox()
+        mm = 25.4 / DEFAULT_DPI
+        tolerance = self.previewTolerance((bbox[0].x * mm, bbox[0].y * mm, bbox[1].x * mm, bbox[1].y * mm), previewSize)
+        polys = self.svgPolys(self.svgText, tolerance)
+
+        self._cached = (key, entry, polys, tolerance)
+        return polys
+
+    def previewTolerance(self, bounds, previewSize):
+        if previewSize is None or bounds is None or min(previewSize) <= 0:
+            return None
+        width = bounds[2] - bounds[0]
+        height = bounds[3] - bounds[1]
+        if width <= 0 or height <= 0:
+            return None
+
+        # The preview scales the label to fit, so this is the size of a pixel in mm
+        pixel = max(width / previewSize[0], height / previewSize[1])
+
+        # Rounded down to a power of two, so it stays the same while the label
+        # is edited and the flattened segments of unchanged lines are reused
+        return 2 ** math.floor(math.log2(self.previewPixelTolerance * pixel))
+
+    def renderSvgText(self, inString):
+        t = self.renderLabel(inString)
+        t.style['fill'] = True
+        return t
 
+    def svgPolys(self, svgText, tolerance=None):
+        mod = Svg2Points(Svg2ModImport(), precision=1.0, scale_factor=1.0, center=True, tolerance=tolerance)
+        mod.add_svg_element(svgText)
+        mod.write()
         return mod.polys
 
+    def diskCacheKey(self):
+        if self.diskCache is None or self.text is None:
+            return None
+        params = dict(self.params, MultiLineText=self.text)
+        return self.diskCache.key(params, tolerance=self.tolerance)
+
     def text_height(self, char_used_for_height='H'):
-        # t is an svg Text element
+        bbox = self.textBBox(char_used_for_height, self.fontName)
+        return bbox[1].y - bbox[0].y
+
+    # ******************************************************************************
+    #
+    # Bounding box a run of text will have once rendered by renderText
+    #
+    #   Found from the font metrics and glyph bounds, so no outlines are
+    #   converted just to measure text. Results are memoized like renderText.
+    #
+    def textBBox(self, inString, fontName, origin=None):
+        if origin is None:
+            origin = svg.Point(0, 0)
+
+        key = (inString, fontName, origin.x, origin.y)
+        bbox = self._bboxCache.get(key)
+        if bbox is not None:
+            self._bboxCache.move_to_end(key)
+            return bbox
+
         t = svg.Text()
+        t.set_font(fontName)
+        t.add_text(inString, origin=origin)
+        bbox = self._bboxCache[key] = t.ink_bbox()
+        while len(self._bboxCache) > self.renderCacheSize:
+            self._bboxCache.popitem(last=False)
+        return bbox
+
+    # ******************************************************************************
+    #
+    # Render a run of text into a converted svg Text element
+    #
+    #   A run is a list of (text, origin) tuples that are all converted at
+    #   once, like the chunks of an inline formatted line.
+    #
+    #   When incremental rendering is enabled the result is memoized, keyed by
+    #   the text, font and origins. Editing one line of a label then only
+    #   converts that line again. The returned element is shared, so it must
+    #   not be modified by the caller.
+    #
+    def renderText(self, inString, fontName, origin=None):
+        if origin is None:
+            origin = svg.Point(0, 0)
+        return self.renderRun([(inString, origin)], fontName)
+
+    def renderRun(self, run, fontName):
+        key = (tuple((s, origin.x, origin.y) for s, origin in run), fontName)
+        if self.incremental:
+            t = self._renderCache.get(key)
+            if t is not None:
+                self._renderCache.move_to_end(key)
+                return t
+
+        t = RenderedText()
+        t.set_font(fontName)
+        for s, origin in run:
+            t.add_text(s, origin=origin)
 
-        t.set_font(self.fontName)
-        t.add_text(char_used_for_height)
-        
         # This needs to be called to convert raw text to useable path elements
         t.convert_to_path()
 
-        bbox = t.bbox()
-        return bbox[1].y - bbox[0].y
+        if self.incremental:
+            self._renderCache[key] = t
+            while len(self._renderCache) > self.renderCacheSize:
+                self._renderCache.popitem(last=False)
+        return t
+
+    def clearRenderCache(self):
+        self._renderCache.clear()
+        self._bboxCache.clear()
 
     # ******************************************************************************
     #
@@ -87,19 +354,17 @@ class Buzzard():
     #
     #
     def renderLabel(self, inString):
-        # t is an svg Text element
-        t = svg.Text()
-
-        t.set_font(self.fontName)
-
         if self.inlineFormat == True:
             t = self.formatString(inString, self.fontName)       
         else:
+            # t is an svg Text element holding one rendered Text per line
+            t = svg.Text()
             for i,s in enumerate(inString.split('\n')):
-                t.add_text(s, origin=svg.Point(0, self.lineSpacing * i))
-                
-            # This needs to be called to convert raw text to useable path elements    
-            t.convert_to_path()    
+                t.paths.append([self.renderText(s, self.fontName, svg.Point(0, self.lineSpacing * i))])
+
+        # The rendered text is shared and already transformed, so only resolve
+        # the style units of the outer element
+        t.transform_styles(t.matrix)
 
         # bounds check padding
         padding = self.padding
@@ -167,9 +432,45 @@ class Buzzard():
 
         return t
 
-    def create_v6_footprint(self, parm_text=None):
-        name = "kibuzzard-{:8X}".format(int(round(time.time())))
-        mod = Svg2ModExportLatestCustom(Svg2ModImport(module_name=name, module_value="G***"), precision=1.0, scale_factor=self.scaleFactor, center=True, params=parm_text)
+    def create_v6_footprint(self, parm_text=None, name=None):
+        tedit = int(round(time.time()))
+        if name is None:
+            name = "kibuzzard-{:8X}".format(tedit)
+
+        # Footprints are cached with a placeholder for the name and edit time
+        key = self.diskCacheKey()
+        if key is None:
+            return self.export_v6_footprint(parm_text, name)
+
+        cached_key, entry, polys, tolerance = self._cached or (None, None, None, None)
+        if cached_key == key and entry is not None and entry.get('params') == parm_text:
+            footprint = entry['footprint']
+            if tolerance != entry.get('preview_tolerance'):
+                # The preview was rendered again, finer than the cached one
+                entry = dict(entry, polys=[p.data.tolist() for p in polys], preview_tolerance=tolerance)
+                self.diskCache.put(key, entry)
+                self._cached = (key, entry, polys, tolerance)
+        else:
+            if self.svgText is None:
+                self.svgText = self.renderSvgText(self.text)
+            if cached_key != key:
+                # Reconfigured since generate(), like a change of layer
+                polys, tolerance = self.svgPolys(self.svgText), None
+            footprint = self.export_v6_footprint(parm_text, cache_name)
+            entry = {
+                'polys': [p.data.tolist() for p in polys],
+                'preview_tolerance': tolerance,
+                'params': parm_text,
+                'footprint': footprint,
+            }
+            self.diskCache.put(key, entry)
+            self._cached = (key, entry, polys, tolerance)
+
+        footprint = footprint.replace(cache_name, name)
+        return cache_tedit.sub("(tedit {:8X})".format(tedit), footprint, count=1)
+
+    def export_v6_footprint(self, parm_text, name):
+        mod = Svg2ModExportLatestCustom(Svg2ModImport(module_name=name, module_value="G***"), precision=1.0, scale_factor=self.scaleFactor, center=True, params=parm_text, tolerance=self.tolerance)
         if self.layer == "F.Cu/F.Mask":
             mod.add_svg_element(self.svgText, layer="F.Cu")
             offset_text = copy.copy(self.svgText)
@@ -189,8 +490,7 @@ class Buzzard():
     #   
     def formatString(self, inString, fontName):
 
-        formattedText = []
-        horizontalOffset = 0
+        formattedText = svg.Text()
         # Get the width of a space for this typeface
         spaceWidth = self.getSpaceWidth(fontName)
 
@@ -203,84 +503,83 @@ class Buzzard():
 
         for lineIndex,lineString in enumerate(inString.split('\n')):
 
-            for chunkIndex,chunk in enumerate(re.split(r"(~{.*?})", lineString)):
+            # The chunks of a line are placed from their measured bounds, then
+            # rendered together as one run
+            run = []
+            lineovers = []
+            horizontalOffset = 0
 
-                chunkPath = svg.Text()
-                chunkPath.set_font(fontName)
-                bbox = any
+            for chunk in inline_markup.split(lineString):
 
                 # Weed out empty matches from the split
-                if len(chunk) > 0 and chunk.isspace() == False:
-
-                    # If this chunk is marked up for overlining...
-                    if chunk.startswith("~{") and chunk.endswith("}"):
-                        chunk = chunk[2:]
+                if len(chunk) == 0 or chunk.isspace():
+                    continue
+
+                # If this chunk is marked up for overlining...
+                overlined = chunk.startswith("~{") and chunk.endswith("}")
+                if overlined:
+                    chunk = chunk[2:-1]
+
+                preSpaces = 0
+                # Count up leading spaces, remove them from the string, and add to the offset
+                while chunk.startswith(" "):
+                    chunk = chunk[1:]
+                    horizontalOffset += spaceWidth
+                    preSpaces += 1
+
+                # Nothing left to draw, like "~{}" or "~{ }"
+                if len(chunk) == 0:
+                    continue
+
+                origin = svg.Point(horizontalOffset, 15*lineIndex)
+                run.append((chunk, origin))
+                bbox = self.textBBox(chunk, fontName, origin)
+
+                if overlined:
+                    postSpaces = 0
+                    # Count up trailing spaces, remove them from the string, and add to the offset
+                    while chunk.endswith(" "):
                         chunk = chunk[:-1]
-                        preSpaces = 0
-                        # Count up leading spaces, remove them from the string, and add to the offset
-                        while chunk.startswith(" "):
-                            chunk = chunk[1:]
-                            horizontalOffset += spaceWidth
-                            preSpaces += 1
-                        # Render the text
-                        chunkPath.add_text(chunk, origin=svg.Point(horizontalOffset, 15*lineIndex))
-                        chunkPath.convert_to_path()
-                        bbox = chunkPath.bbox()
-                        postSpaces = 0
-                        # Count up trailing spaces, remove them from the string, and add to the offset
-                        while chunk.endswith(" "):
-                            chunk = chunk[:-1]
-                            horizontalOffset += spaceWidth
-                            postSpaces += 1
-                        # If this is the first chunk we've rendered, use chunkPath to set the variable type
-                        if formattedText == []:
-                            formattedText = chunkPath            
-                        else:
-                            formattedText.paths.append([chunkPath])     
-                        # Render the overline
-                        if self.lineOverStyle == "Square":                                  
-                            pstr = "M {},{} ".format(bbox[0].x - (preSpaces*spaceWidth), bbox[0].y-1)
-                            pstr += "L {},{} ".format(bbox[0].x - (preSpaces*spaceWidth), bbox[0].y-(self.lineOverThickness+1))
-                            pstr += "L {},{} ".format(bbox[1].x + (postSpaces*spaceWidth), bbox[0].y-(self.lineOverThickness+1))
-                            pstr += "L {},{} ".format(bbox[1].x + (postSpaces*spaceWidth), bbox[0].y-1)
-                            pstr += "z"
-                        elif self.lineOverStyle == "Rounded":
-                            pstr = "M {},{} ".format(bbox[0].x - (preSpaces*spaceWidth), bbox[0].y-1)
-                            pstr += "a {},{} 0 0 1 0,{} ".format(self.lineOverThickness/2, self.lineOverThickness/2,-self.lineOverThickness)                            
-                            pstr += "L {},{} ".format(bbox[1].x + (postSpaces*spaceWidth), bbox[0].y-(self.lineOverThickness+1))
-                            pstr += "a {},{} 0 0 1 0,{} ".format(self.lineOverThickness/2, self.lineOverThickness/2,self.lineOverThickness)
-                            pstr += "z"
-
-                        p = svg.Path()
-                        p.parse(pstr)
-                        formattedText.paths.append([p])
-                        horizontalOffset += bbox[1].x - bbox[0].x
-
-                    # If this chunk is not marked up for overlining...
-                    else:
-                        # Count up leading spaces, remove them from the string, and add to the offset
-                        while chunk.startswith(" "):
-                            chunk = chunk[1:]
-                            horizontalOffset += spaceWidth
-                        # Render the text
-                        chunkPath.add_text(chunk, origin=svg.Point(horizontalOffset, 15*lineIndex))                        
-                        chunkPath.convert_to_path()
-                        bbox = chunkPath.bbox()
-                        horizontalOffset += bbox[1].x - bbox[0].x 
-                        # Count up trailing spaces, remove them from the string, and add to the offset
-                        while chunk.endswith(" "):
-                            chunk = chunk[:-1]
-                            horizontalOffset += spaceWidth
-                        # If this is the first chunk we've rendered, use chunkPath to set the variable type
-                        if formattedText == []:
-                            formattedText = chunkPath
-                        else:
-                            formattedText.paths.append([chunkPath])
-                        
-            horizontalOffset = 0
+                        horizontalOffset += spaceWidth
+                        postSpaces += 1
+                    lineovers.append(self.lineoverPath(bbox, preSpaces*spaceWidth, postSpaces*spaceWidth))
+                    horizontalOffset += bbox[1].x - bbox[0].x
+                else:
+                    horizontalOffset += bbox[1].x - bbox[0].x
+                    # Count up trailing spaces, remove them from the string, and add to the offset
+                    while chunk.endswith(" "):
+                        chunk = chunk[:-1]
+                        horizontalOffset += spaceWidth
+
+            if run:
+                formattedText.paths.append([self.renderRun(run, fontName)])
+            for p in lineovers:
+                if p is not None:
+                    formattedText.paths.append([p])
 
         return(formattedText)
 
+    # Lineover bar above the ink of a chunk, extended over its leading and trailing spaces
+    def lineoverPath(self, bbox, preWidth, postWidth):
+        if self.lineOverStyle == "Square":                                  
+            pstr = "M {},{} ".format(bbox[0].x - preWidth, bbox[0].y-1)
+            pstr += "L {},{} ".format(bbox[0].x - preWidth, bbox[0].y-(self.lineOverThickness+1))
+            pstr += "L {},{} ".format(bbox[1].x + postWidth, bbox[0].y-(self.lineOverThickness+1))
+            pstr += "L {},{} ".format(bbox[1].x + postWidth, bbox[0].y-1)
+            pstr += "z"
+        elif self.lineOverStyle == "Rounded":
+            pstr = "M {},{} ".format(bbox[0].x - preWidth, bbox[0].y-1)
+            pstr += "a {},{} 0 0 1 0,{} ".format(self.lineOverThickness/2, self.lineOverThickness/2,-self.lineOverThickness)                            
+            pstr += "L {},{} ".format(bbox[1].x + postWidth, bbox[0].y-(self.lineOverThickness+1))
+            pstr += "a {},{} 0 0 1 0,{} ".format(self.lineOverThickness/2, self.lineOverThickness/2,self.lineOverThickness)
+            pstr += "z"
+        else:
+            return None
+
+        p = svg.Path()
+        p.parse(pstr)
+        return p
+
     # Detect endcap characters and remove them, also set the endcap style accordingly
     def extractEndcaps(self, string):
         
@@ -305,13 +604,39 @@ class Buzzard():
     # width of a full-stop as our proxy
     def getSpaceWidth(self, font):
 
-        scratchPad = svg.Text()
-        scratchPad.set_font(font)
-        scratchPad.add_text(".")
-        scratchPad.convert_to_path()
-        bbox = scratchPad.bbox()
+        bbox = self.textBBox(".", font)
         return bbox[1].x - bbox[0].x            
 
+class RenderedText( svg.Text ):
+    ''' A svg Text element that is not modified once it has been
+    converted to paths, so the flattened segments and the extents
+    can be reused by every export of the label that contains it.
+    '''
+
+    def __init__( self, *args, **kwargs ):
+        super( RenderedText, self ).__init__( *args, **kwargs )
+        self._segments = {}
+        self._bbox = None
+
+    def convert_to_path( self, auto_transform=True ):
+        self._segments = {}
+        self._bbox = None
+        super( RenderedText, self ).convert_to_path( auto_transform )
+
+    def bbox( self ):
+        if self._bbox is None:
+            self._bbox = super( RenderedText, self ).bbox()
+        return self._bbox
+
+    def segments( self, precision=0, tolerance=None ):
+        segments = self._segments.get( ( precision, tolerance ) )
+        if segments is None:
+            segments = self._segments[ ( precision, tolerance ) ] = super( RenderedText, self ).segments( precision, tolerance )
+
+        # Hand out copies of the lists, the points themselves are not modified
+        return [ list( segment ) for segment in segments ]
+
+
 class Svg2ModExportLatestCustom( Svg2ModExportLatest ):
     
     def __init__(
@@ -323,7 +648,9 @@ class Svg2ModExportLatestCustom( Svg2ModExportLatest ):
         precision = 1.0,
         use_mm = True,
         dpi = DEFAULT_DPI,
-        params = None
+        params = None,
+        tolerance = None,
+        grid = DEFAULT_GRID,
     ):
         self.params = params
         super( Svg2ModExportLatestCustom, self ).__init__(
@@ -335,6 +662,8 @@ class Svg2ModExportLatestCustom( Svg2ModExportLatest ):
             use_mm,
             dpi,
             pads = False,
+            tolerance = tolerance,
+            grid = grid,
         )
 
 
@@ -398,6 +727,7 @@ class Svg2Points( Svg2ModExport ):
         precision = 20.0,
         use_mm = True,
         dpi = DEFAULT_DPI,
+        tolerance = None,
     ):
         super( Svg2Points, self ).__init__(
             svg2mod_import,
@@ -408,6 +738,7 @@ class Svg2Points( Svg2ModExport ):
             use_mm,
             dpi,
             pads = False,
+            tolerance = tolerance,
         )
 
         self.include_reverse = False
@@ -491,8 +822,7 @@ class Svg2Points( Svg2ModExport ):
     #------------------------------------------------------------------------
 
     def _write_polygon_header( self, points, layer ):
-        self.polys.append([])
-        pass
+        self.polys.append(svg.PointArray())
 
 
     #------------------------------------------------------------------------
@@ -501,6 +831,12 @@ class Svg2Points( Svg2ModExport ):
         self.polys[-1].append(point)
 
 
+    #------------------------------------------------------------------------
+
+    def _write_polygon_points( self, points ):
+        self.polys[-1].extend(points)
+
+
     #------------------------------------------------------------------------
 
     def _write_polygon_segment( self, p, q, layer, stroke_width ):
@@ -0,0 +1,86 @@
+'''
+Persistent cache of finished labels.
+
+Entries are stored as one JSON file per label, named by a hash of the
+label parameters (the settings stored in the footprint kb_params) and the
+engine settings that shape the output. Labels that are made again and
+again, like "GND" or "3V3", come back without rendering, also in later
+sessions. Once the cache grows past max_size bytes the least recently used
+entries are removed.
+'''
+
+import hashlib
+import json
+import os
+import tempfile
+
+# Bump when a change to the renderer changes its output, so labels from
+# older versions are rendered again instead of read from the cache
+ENGINE_VERSION = 1
+
+class RenderCache():
+
+    def __init__(self, directory, max_size=32*1024*1024):
+        self.directory = directory
+        self.max_size = max_size
+
+    def key(self, params, **engine):
+        # Canonical JSON, so the same label always hashes the same
+        data = json.dumps({'version': ENGINE_VERSION, 'engine': engine, 'params': params},
+            sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            # The modification time orders entries for eviction
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def put(self, key, entry):
+        # Written to a temporary file first, so readers never see half an entry
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, separators=(',', ':'))
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            # Don't throw exception if the cache can't be written
+            return False
+        self.evict()
+        return True
+
+    def evict(self, max_size=None):
+        if max_size is None:
+            max_size = self.max_size
+
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith('.json'):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        except OSError:
+            return
+
+        size = sum(e[1] for e in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= entry_size
+
+    def clear(self):
+        self.evict(0)
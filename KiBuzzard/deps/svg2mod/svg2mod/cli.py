@@ -20,16 +20,19 @@ as a tool in a terminal.
 '''
 
 import argparse
+import concurrent.futures
+import glob
 import logging
 import os
 import shlex
 import sys
+import time
 import traceback
 
 import svg2mod.coloredlogger as coloredlogger
 from svg2mod.coloredlogger import logger, unfiltered_logger
 from svg2mod import svg
-from svg2mod.exporter import (DEFAULT_DPI, Svg2ModExportLatest,
+from svg2mod.exporter import (DEFAULT_DPI, DEFAULT_GRID, Svg2ModExportLatest,
                               Svg2ModExportLegacy, Svg2ModExportLegacyUpdater,
                               Svg2ModExportPretty)
 from svg2mod.importer import Svg2ModImport
@@ -81,85 +84,218 @@ def main():
             logger.critical("Error: decimal units only allowed with legacy output type")
             sys.exit( -1 )
 
+    if pretty:
+        exporter_class = Svg2ModExportPretty if args.format == "pretty" else Svg2ModExportLatest
+    else:
+        exporter_class = Svg2ModExportLegacy
+
+    cmd_args = [os.path.basename(sys.argv[0])] + sys.argv[1:]
+    cmdline = ' '.join(shlex.quote(x) for x in cmd_args)
+
+    if is_batch_input(args.input_file_name):
+        sys.exit(convert_batch(args, exporter_class, cmdline))
+
     try:
-        # Import the SVG:
-        imported = Svg2ModImport(
+        convert(
+            args,
+            exporter_class,
             args.input_file_name,
-            args.module_name,
-            args.module_value,
-            args.ignore_hidden,
-            args.force_layer
+            args.output_file_name,
+            args.module_name or "svg2mod",
+            cmdline,
         )
+    except Exception as e:
+        if args.debug_print:
+            traceback.print_exc()
+        else:
+            logger.critical(f'Unhandled exception (Exiting)\n {type(e).__name__}: {e} ')
+        exit(-1)
 
-        # Pick an output file name if none was provided:
-        if args.output_file_name is None:
+#----------------------------------------------------------------------------
 
-            args.output_file_name = os.path.splitext(
-                os.path.basename( args.input_file_name )
-            )[ 0 ]
+def convert(args, exporter_class, input_file_name, output_file_name, module_name, cmdline):
+    '''Convert a single svg file with the options in args
+    and return the name of the written module file.
+    '''
 
-        # Append the correct file name extension if needed:
-        if pretty:
-            extension = ".kicad_mod"
-        else:
-            extension = ".mod"
-        if args.output_file_name[ - len( extension ) : ] != extension:
-            args.output_file_name += extension
+    pretty = args.format in ['pretty','latest']
+    use_mm = args.units == 'mm'
+
+    # Import the SVG, skipping anything not on a layer of the exporter:
+    imported = Svg2ModImport(
+        input_file_name,
+        module_name,
+        args.module_value,
+        args.ignore_hidden,
+        args.force_layer,
+        exporter_class.layer_map.keys(),
+    )
+
+    # Pick an output file name if none was provided:
+    if output_file_name is None:
 
-        # Create an exporter:
-        if pretty:
-            exported = (Svg2ModExportPretty if args.format == "pretty" else Svg2ModExportLatest)(
+        output_file_name = os.path.splitext(
+            os.path.basename( input_file_name )
+        )[ 0 ]
+
+    # Append the correct file name extension if needed:
+    if pretty:
+        extension = ".kicad_mod"
+    else:
+        extension = ".mod"
+    if output_file_name[ - len( extension ) : ] != extension:
+        output_file_name += extension
+
+    # Create an exporter:
+    if pretty:
+        exported = exporter_class(
+            imported,
+            output_file_name,
+            args.center,
+            args.scale_factor,
+            args.precision,
+            dpi = args.dpi,
+            pads = args.convert_to_pads,
+            tolerance = args.tolerance,
+            grid = args.grid,
+        )
+
+    else:
+
+        # If the module file exists, try to read it:
+        exported = None
+        if os.path.isfile( output_file_name ):
+
+            try:
+                exported = Svg2ModExportLegacyUpdater(
+                    imported,
+                    output_file_name,
+                    args.center,
+                    args.scale_factor,
+                    args.precision,
+                    args.dpi,
+                    tolerance = args.tolerance,
+                    grid = args.grid,
+                )
+
+            except Exception as e:
+                raise e
+
+        # Write the module file:
+        if exported is None:
+            exported = Svg2ModExportLegacy(
                 imported,
-                args.output_file_name,
+                output_file_name,
                 args.center,
                 args.scale_factor,
                 args.precision,
+                use_mm = use_mm,
                 dpi = args.dpi,
-                pads = args.convert_to_pads,
+                tolerance = args.tolerance,
+                grid = args.grid,
             )
 
-        else:
+    # Export the footprint:
+    exported.write(cmdline)
 
-            # If the module file exists, try to read it:
-            exported = None
-            if os.path.isfile( args.output_file_name ):
-
-                try:
-                    exported = Svg2ModExportLegacyUpdater(
-                        imported,
-                        args.output_file_name,
-                        args.center,
-                        args.scale_factor,
-                        args.precision,
-                        args.dpi,
-                    )
-
-                except Exception as e:
-                    raise e
-
-            # Write the module file:
-            if exported is None:
-                exported = Svg2ModExportLegacy(
-                    imported,
-                    args.output_file_name,
-                    args.center,
-                    args.scale_factor,
-                    args.precision,
-                    use_mm = use_mm,
-                    dpi = args.dpi,
-                )
+    return output_file_name
+
+#----------------------------------------------------------------------------
+
+def is_batch_input(input_file_name):
+    '''A directory or a glob pattern selects batch conversion'''
+    return os.path.isdir(input_file_name) or glob.has_magic(input_file_name)
+
+#----------------------------------------------------------------------------
 
-        cmd_args = [os.path.basename(sys.argv[0])] + sys.argv[1:]
-        cmdline = ' '.join(shlex.quote(x) for x in cmd_args)
+def convert_batch(args, exporter_class, cmdline):
+    '''Convert every svg file selected by args.input_file_name, a
+    directory or a glob pattern, across a pool of worker processes.
 
-        # Export the footprint:
-        exported.write(cmdline)
+    Each file becomes its own module file, named after the svg file and
+    written to the output directory if one was given or else next to
+    the svg file. A .pretty output directory is a KiCad footprint library.
+
+    System fonts are indexed once here and handed to the workers.
+    Returns the exit code.
+    '''
+
+    if os.path.isdir(args.input_file_name):
+        pattern = os.path.join(glob.escape(args.input_file_name), "*.svg")
+    else:
+        pattern = args.input_file_name
+    input_files = sorted(f for f in glob.glob(pattern) if os.path.isfile(f))
+    if not input_files:
+        logger.critical(f"No svg files found in {args.input_file_name}")
+        return -1
+
+    output_dir = args.output_file_name
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    # Only scan the system fonts if some file has text to convert
+    system_fonts = None
+    for input_file in input_files:
+        with open(input_file, 'rb') as f:
+            if b'<text' in f.read():
+                system_fonts = svg.Text.load_system_fonts()
+                break
+
+    jobs = []
+    for input_file in input_files:
+        name = os.path.splitext(os.path.basename(input_file))[0]
+        output_file = os.path.join(output_dir or os.path.dirname(input_file), name)
+        jobs.append((input_file, output_file, args.module_name or name))
+
+    processes = max(1, min(args.jobs or 1, len(jobs)))
+    unfiltered_logger.info(f"Converting {len(jobs)} files with {processes} processes")
+    start = time.perf_counter()
+    failed = 0
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers = processes,
+        initializer = _init_batch_worker,
+        initargs = (logger.level, system_fonts, svg.Text.default_font),
+    ) as executor:
+        results = [
+            executor.submit(_convert_batch_file, args, exporter_class, job, cmdline)
+            for job in jobs
+        ]
+        for result in concurrent.futures.as_completed(results):
+            input_file, output_file, seconds, error = result.result()
+            if error:
+                failed += 1
+                logger.error(f"{input_file}: {error}")
+            else:
+                unfiltered_logger.info(f"{input_file} -> {output_file} ({seconds:.2f} s)")
+
+    unfiltered_logger.info("Converted {} of {} files in {:.2f} s".format(
+        len(jobs) - failed, len(jobs), time.perf_counter() - start))
+    return -1 if failed else 0
+
+#----------------------------------------------------------------------------
+
+def _init_batch_worker(level, system_fonts, default_font):
+    '''Set up a batch worker process like the main process'''
+    logger.setLevel(level)
+    if system_fonts is not None:
+        svg.Text._system_fonts = system_fonts
+    svg.Text.default_font = default_font
+
+#----------------------------------------------------------------------------
+
+def _convert_batch_file(args, exporter_class, job, cmdline):
+    '''Convert one file of a batch and return
+    (input file, output file, seconds taken, error message or None).
+    '''
+    input_file, output_file, module_name = job
+    start = time.perf_counter()
+    try:
+        output_file = convert(args, exporter_class, input_file, output_file, module_name, cmdline)
     except Exception as e:
         if args.debug_print:
             traceback.print_exc()
-        else:
-            logger.critical(f'Unhandled exception (Exiting)\n {type(e).__name__}: {e} ')
-        exit(-1)
+        return input_file, output_file, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+    return input_file, output_file, time.perf_counter() - start, None
 
 #----------------------------------------------------------------------------
 
@@ -181,7 +317,7 @@ def get_arguments():
         type = str,
         dest = 'input_file_name',
         metavar = 'IN_FILENAME',
-        help = "Name of the SVG file",
+        help = "Name of the SVG file, or a directory or glob pattern of SVG files to convert in parallel",
     )
 
     mux.add_argument(
@@ -197,7 +333,16 @@ def get_arguments():
         type = str,
         dest = 'output_file_name',
         metavar = 'FILENAME',
-        help = "Name of the module file",
+        help = "Name of the module file, or the output directory when converting several files. A directory ending in .pretty is a footprint library",
+    )
+
+    parser.add_argument(
+        '-j', '--jobs',
+        type = int,
+        dest = 'jobs',
+        metavar = 'JOBS',
+        help = "Number of processes used when converting several files (int). Defaults to the number of CPUs",
+        default = os.cpu_count(),
     )
 
     parser.add_argument(
@@ -280,6 +425,22 @@ def get_arguments():
         help = "Smoothness for approximating curves with line segments. Input is the approximate length for each line segment in SVG pixels (float)",
         default = 5.0,
     )
+    parser.add_argument(
+        '--tolerance',
+        type = float,
+        dest = 'tolerance',
+        metavar = 'TOLERANCE',
+        help = "Approximate curves adaptively, with at most this deviation from the curve in mm (float). Overrides --precision",
+        default = None,
+    )
+    parser.add_argument(
+        '--grid',
+        type = float,
+        dest = 'grid',
+        metavar = 'GRID',
+        help = "Snap points to this grid in mm and drop points on straight lines, 0 to disable (float). Defaults to 1nm",
+        default = DEFAULT_GRID,
+    )
     parser.add_argument(
         '--format',
         type = str,
@@ -295,8 +456,8 @@ def get_arguments():
         type = str,
         dest = 'module_name',
         metavar = 'NAME',
-        help = "Base name of the module",
-        default = "svg2mod",
+        help = "Base name of the module. Defaults to svg2mod, or to the name of each SVG file when converting several files",
+        default = None,
     )
 
     parser.add_argument(
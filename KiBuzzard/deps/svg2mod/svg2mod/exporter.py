@@ -20,6 +20,7 @@ the file information  used in kicad module files.
 '''
 
 
+import collections
 import copy
 import datetime
 import io
@@ -32,12 +33,13 @@ from abc import ABC, abstractmethod
 from svg2mod import svg
 from svg2mod.coloredlogger import logger, unfiltered_logger
 from svg2mod.importer import Svg2ModImport
-from svg2mod.svg2mod import PolygonSegment
+from svg2mod.svg2mod import BoundingBoxIndex, PolygonSegment
 
 #----------------------------------------------------------------------------
 
 DEFAULT_DPI = 96 # 96 as of Inkscape 0.92
 MINIMUM_SIZE = 1e-5 # Minimum size kicad will render
+DEFAULT_GRID = 1e-6 # KiCad stores coordinates in nm
 
 #----------------------------------------------------------------------------
 
@@ -83,6 +85,13 @@ class Svg2ModExport(ABC):
     @abstractmethod
     def _write_polygon_point( self, point ):pass
 
+    def _write_polygon_points( self, points ):
+        ''' Write all points of a polygon. Exporters that can format
+        a whole polygon at once should override this.
+        '''
+        for point in points:
+            self._write_polygon_point( point )
+
     @abstractmethod
     def _write_polygon_segment( self, p, q, layer, stroke_width ):pass
 
@@ -141,6 +150,8 @@ class Svg2ModExport(ABC):
         use_mm = True,
         dpi = DEFAULT_DPI,
         pads = False,
+        tolerance = None,
+        grid = DEFAULT_GRID,
     ):
         if use_mm:
             # 25.4 mm/in;
@@ -158,6 +169,12 @@ class Svg2ModExport(ABC):
         self.use_mm = use_mm
         self.dpi = dpi
         self.convert_pads = pads
+        # Maximum deviation of flattened curves in mm, if set curves are
+        # subdivided adaptively and precision is not used
+        self.tolerance = tolerance
+        # Grid in mm that polygon points are snapped to when writing mm,
+        # points within one grid step of a straight line are dropped
+        self.grid = grid
 
         # Local instance variables
         self.translation = None
@@ -273,6 +290,18 @@ class Svg2ModExport(ABC):
 
     #------------------------------------------------------------------------
 
+    def _get_svg_tolerance( self ):
+        '''Return the tolerance converted from mm to svg units'''
+        if self.tolerance is None:
+            return None
+        tolerance = self.tolerance
+        if not self.use_mm:
+            tolerance *= 10000.0 / 25.4
+        return tolerance / self.scale_factor
+
+
+    #------------------------------------------------------------------------
+
     def _write_items( self, items, layer, flip = False ):
 
         for item in items:
@@ -292,7 +321,8 @@ class Svg2ModExport(ABC):
                 segments = [
                     PolygonSegment( segment )
                     for segment in item.segments(
-                        precision = self.precision
+                        precision = self.precision,
+                        tolerance = self._get_svg_tolerance(),
                     )
                 ]
 
@@ -313,27 +343,31 @@ class Svg2ModExport(ABC):
                     # Sort segments in order of size
                     segments.sort(key=lambda v: svg.Segment(v.bbox[0], v.bbox[1]).length(), reverse=True)
 
+                    # Shapes can only contain each other when their bounding boxes
+                    # overlap, so each one is only tested against those
+                    remaining = BoundingBoxIndex(segments)
+
                     # Write all segments
-                    while len(segments) > 0:
-                        inlinable = [segments[0]]
+                    for segment in segments:
+                        if segment not in remaining:
+                            continue
+                        remaining.remove(segment)
+                        inlinable = [segment]
+                        holes = BoundingBoxIndex(cell_size=remaining.cell_size)
 
                         # Search to see if any paths are contained in the current shape
-                        for seg in segments[1:]:
+                        for seg in (remaining.overlapping(segment.bbox) if fill else []):
                             # Contained in parent shape
-                            if fill and not inlinable[0].are_distinct(seg):
-                                append = True
-                                if len(inlinable) > 1:
-                                    for hole in inlinable[1:]:
-                                        # Contained in a hole. It is separate
-                                        if not hole.are_distinct(seg):
-                                            append = False
-                                            break
-                                if append: inlinable.append(seg)
-                        for poly in inlinable:
-                            segments.pop(segments.index(poly))
+                            if not segment.are_distinct(seg):
+                                # Contained in a hole. It is separate
+                                if all(hole.are_distinct(seg) for hole in holes.overlapping(seg.bbox)):
+                                    inlinable.append(seg)
+                                    holes.add(seg)
+                        for poly in inlinable[1:]:
+                            remaining.remove(poly)
                         if len(inlinable) > 1:
                             points = inlinable[ 0 ].inline( inlinable[ 1 : ] )
-                        elif len(inlinable) > 0:
+                        else:
                             points = inlinable[ 0 ].points
 
                         logger.info( "  Writing {} with {} points".format(item.__class__.__name__, len( points ) ))
@@ -401,10 +435,61 @@ class Svg2ModExport(ABC):
         self._write_module_footer( front )
 
 
+    #------------------------------------------------------------------------
+
+    def _simplify_points( self, points ):
+        ''' Snap points to the grid, then drop points that repeat the
+        previous one or lie within one grid step of the straight line
+        between the points around them. Points where the outline turns
+        back on itself are kept, as are points visited more than once,
+        so the ends of hole bridges stay where they are.
+        '''
+
+        if not self.grid or not self.use_mm:
+            return points
+
+        grid = self.grid
+        snapped = [ ( round( point.x / grid ), round( point.y / grid ) ) for point in points ]
+        visits = collections.Counter( snapped )
+
+        kept = []
+        # Points dropped between the last two kept points
+        dropped = []
+
+        for c in snapped:
+            if kept and c == kept[ -1 ]:
+                continue
+
+            if len( kept ) > 1 and kept[ -2 ] != c and visits[ kept[ -1 ] ] == 1:
+                a = kept[ -2 ]
+                dx = c[ 0 ] - a[ 0 ]
+                dy = c[ 1 ] - a[ 1 ]
+                length_sq = dx * dx + dy * dy
+                run = dropped + [ kept[ -1 ] ]
+                for b in run:
+                    bx = b[ 0 ] - a[ 0 ]
+                    by = b[ 1 ] - a[ 1 ]
+                    cross = dx * by - dy * bx
+                    dot = dx * bx + dy * by
+                    if cross * cross > length_sq or dot < 0 or dot > length_sq:
+                        break
+                else:
+                    kept[ -1 ] = c
+                    dropped = run
+                    continue
+
+            kept.append( c )
+            dropped = []
+
+        return [ svg.Point( x * grid, y * grid ) for x, y in kept ]
+
+
     #------------------------------------------------------------------------
 
     def _write_polygon( self, points, layer, fill, stroke, stroke_width ):
 
+        points = self._simplify_points( points )
+
         if fill and len(points) > 2:
             self._write_polygon_filled(
                 points, layer, stroke_width
@@ -434,8 +519,7 @@ class Svg2ModExport(ABC):
 
         self._write_polygon_header( points, layer )
 
-        for point in points:
-            self._write_polygon_point( point )
+        self._write_polygon_points( points )
 
         self._write_polygon_footer( layer, stroke_width )
 
@@ -558,6 +642,8 @@ class Svg2ModExportLegacy( Svg2ModExport ):
         precision = 20.0,
         use_mm = True,
         dpi = DEFAULT_DPI,
+        tolerance = None,
+        grid = DEFAULT_GRID,
     ):
         super( Svg2ModExportLegacy, self ).__init__(
             svg2mod_import,
@@ -568,6 +654,8 @@ class Svg2ModExportLegacy( Svg2ModExport ):
             use_mm,
             dpi,
             pads = False,
+            tolerance = tolerance,
+            grid = grid,
         )
 
         self.include_reverse = True
@@ -741,6 +829,8 @@ class Svg2ModExportLegacyUpdater( Svg2ModExportLegacy ):
         precision = 20.0,
         dpi = DEFAULT_DPI,
         include_reverse = True,
+        tolerance = None,
+        grid = DEFAULT_GRID,
     ):
         self.file_name = file_name
         use_mm = self._parse_output_file()
@@ -753,6 +843,8 @@ class Svg2ModExportLegacyUpdater( Svg2ModExportLegacy ):
             precision,
             use_mm,
             dpi,
+            tolerance = tolerance,
+            grid = grid,
         )
 
 
@@ -1140,8 +1232,7 @@ class Svg2ModExportPretty( Svg2ModExport ):
     def _write_polygon_filled( self, points, layer, stroke_width = 0):
         self._write_polygon_header( points, layer, stroke_width)
 
-        for point in points:
-            self._write_polygon_point( point )
+        self._write_polygon_points( points )
 
         self._write_polygon_footer( layer, stroke_width )
 
@@ -1253,12 +1344,20 @@ class Svg2ModExportPretty( Svg2ModExport ):
 
     def _write_polygon_point( self, point ):
 
-        if self._extra_indent:
-            self.output_file.write("  "*self._extra_indent)
+        self._write_polygon_points( [point] )
 
-        self.output_file.write(
-            "      (xy {} {})\n".format( point.x, point.y )
-        )
+
+    #------------------------------------------------------------------------
+
+    def _write_polygon_points( self, points ):
+        ''' Format the whole polygon in one go. Coordinates are written
+        with 6 decimals, which is the 1nm resolution kicad stores.
+        '''
+
+        xy = "  "*self._extra_indent + "      (xy {:.6f} {:.6f})\n"
+        self.output_file.write("".join(map(
+            xy.format, [point.x for point in points], [point.y for point in points]
+        )))
 
 
     #------------------------------------------------------------------------
@@ -1407,8 +1506,7 @@ class Svg2ModExportLatest(Svg2ModExportPretty):
     def _write_polygon_outline( self, points, layer, stroke_width = 0):
         self._write_polygon_header( points, layer, stroke_width)
 
-        for point in points:
-            self._write_polygon_point( point )
+        self._write_polygon_points( points )
 
         self._write_polygon_footer( layer, stroke_width, fill=False )
 
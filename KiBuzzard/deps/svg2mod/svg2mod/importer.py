@@ -51,7 +51,7 @@ class Svg2ModImport:
 
     #------------------------------------------------------------------------
 
-    def __init__( self, file_name=None, module_name="svg2mod", module_value="G***", ignore_hidden=False, force_layer=None):
+    def __init__( self, file_name=None, module_name="svg2mod", module_value="G***", ignore_hidden=False, force_layer=None, layers=None):
 
         self.file_name = file_name
         self.module_name = module_name
@@ -61,7 +61,8 @@ class Svg2ModImport:
         if file_name:
             unfiltered_logger.info( "Parsing SVG..." )
 
-            self.svg = svg.parse( file_name )
+            # Everything ends up on the forced layer, so nothing can be dropped by layer
+            self.svg = svg.parse( file_name, None if force_layer else layers, ignore_hidden )
             logger.info("Document scaling: {} units per pixel".format(self.svg.viewport_scale))
         if force_layer:
             new_layer = svg.Group()
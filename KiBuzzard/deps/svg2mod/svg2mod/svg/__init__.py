@@ -4,8 +4,10 @@ to objects that can be simplified into points.
 '''
 #__all__ = ['geometry', 'svg']
 
+from .geometry import PointArray
 from .svg import *
 
-def parse(filename):
-    '''Take in a filename and return a SVG object of parsed file'''
-    return Svg(filename)
+def parse(filename, layers=None, ignore_hidden=False):
+    '''Take in a filename and return a SVG object of parsed file.
+    See Svg.parse for layers and ignore_hidden.'''
+    return Svg(filename, layers, ignore_hidden)
@@ -23,9 +23,12 @@ related to SVG parsing. It can be reused outside the scope of SVG.
 import math
 import numbers
 import operator
+from array import array
 
 class Point:
     '''Define a point as two floats accessible by x and y'''
+    __slots__ = ('x', 'y')
+
     def __init__(self, x=None, y=None):
         '''A Point is defined either by a tuple/list of length 2 or
            by 2 coordinates
@@ -133,6 +136,143 @@ class Point:
         return Point( round(self.x, num_digits), round(self.y, num_digits))
 
 
+class PointArray:
+    '''A compact list of points, stored as x and y values
+       interleaved in a single array of doubles.
+       Bulk operations run on the floats directly, Points are only
+       created when items are accessed one by one'''
+    __slots__ = ('data',)
+
+    def __init__(self, points=None):
+        '''Create from Points or (x, y) tuples
+        >>> PointArray([Point(1,2), (3,4)])
+        PointArray[(1.000,2.000), (3.000,4.000)]
+        '''
+        self.data = array('d')
+        if points is not None:
+            for point in points:
+                self.append(point)
+
+    @classmethod
+    def from_coords(cls, xs, ys):
+        '''Create from separate sequences of x and y values'''
+        ret = cls()
+        data = [0.0] * (2 * len(xs))
+        data[0::2] = xs
+        data[1::2] = ys
+        ret.data = array('d', data)
+        return ret
+
+    def append(self, point):
+        '''Add a Point or (x, y) tuple to the end'''
+        if isinstance(point, Point):
+            self.data.append(point.x)
+            self.data.append(point.y)
+        else:
+            self.data.append(float(point[0]))
+            self.data.append(float(point[1]))
+
+    def extend(self, points):
+        '''Add Points to the end'''
+        coords = []
+        for point in points:
+            coords.append(point.x)
+            coords.append(point.y)
+        self.data.extend(coords)
+
+    def __len__(self):
+        return len(self.data) // 2
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            ret = PointArray()
+            ret.data = array('d', [v for j in range(*i.indices(len(self))) for v in self.data[2*j:2*j+2]])
+            return ret
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('PointArray index out of range')
+        return Point(self.data[2*i], self.data[2*i+1])
+
+    def __iter__(self):
+        data = self.data
+        for i in range(0, len(data), 2):
+            yield Point(data[i], data[i+1])
+
+    def __eq__(self, other):
+        if not isinstance(other, PointArray):
+            return NotImplemented
+        return self.data == other.data
+
+    def __repr__(self):
+        return 'PointArray[' + ', '.join(repr(p) for p in self) + ']'
+
+    def xs(self):
+        '''Return all x values'''
+        return self.data[0::2]
+
+    def ys(self):
+        '''Return all y values'''
+        return self.data[1::2]
+
+    def coords(self, scale=1.0):
+        '''Return the points as a list of (x, y) tuples, optionally scaled'''
+        data = self.data
+        if scale != 1.0:
+            data = [v * scale for v in data]
+        it = iter(data)
+        return list(zip(it, it))
+
+    def bbox(self):
+        '''Bounding box (P1,P2) of all points'''
+        if not self.data:
+            return (Point(0, 0), Point(0, 0))
+        xs = self.xs()
+        ys = self.ys()
+        return (Point(min(xs), min(ys)), Point(max(xs), max(ys)))
+
+    def transform(self, matrix):
+        '''Transform every point in place by a svg Matrix
+           or its [a, b, c, d, e, f] values'''
+        a, b, c, d, e, f = getattr(matrix, 'vect', matrix)
+        data = self.data
+        xs = data[0::2]
+        ys = data[1::2]
+        data[0::2] = array('d', [x * a + y * c + e for x, y in zip(xs, ys)])
+        data[1::2] = array('d', [x * b + y * d + f for x, y in zip(xs, ys)])
+
+    def dedup(self):
+        '''Remove consecutive duplicate points in place'''
+        data = self.data
+        ret = array('d', data[0:2])
+        for i in range(2, len(data), 2):
+            if data[i] != ret[-2] or data[i+1] != ret[-1]:
+                ret.append(data[i])
+                ret.append(data[i+1])
+        self.data = ret
+
+    def contains(self, point):
+        '''Return True if point is inside the polygon (even-odd rule).
+           The polygon is implicitly closed'''
+        if isinstance(point, Point):
+            px, py = point.x, point.y
+        else:
+            px, py = point
+        data = self.data
+        if len(data) < 6:
+            # Fewer than 3 points enclose nothing
+            return False
+        inside = False
+        x1, y1 = data[-2], data[-1]
+        for i in range(0, len(data), 2):
+            x2, y2 = data[i], data[i+1]
+            if (y1 > py) != (y2 > py):
+                if px < (x2 - x1) * (py - y1) / (y2 - y1) + x1:
+                    inside = not inside
+            x1, y1 = x2, y2
+        return inside
+
+
 class Angle:
     '''Define a trigonometric angle [of a vector] '''
     def __init__(self, arg):
@@ -174,7 +314,7 @@ class Segment:
     def __str__(self):
         return 'Segment from ' + str(self.start) + ' to ' + str(self.end)
 
-    def segments(self, __=0):
+    def segments(self, __=0, tolerance=None):
         ''' Segments is simply the segment start -> end'''
         return [self.start, self.end]
 
@@ -262,10 +402,22 @@ class Bezier:
 
         return (Point(xmin,ymin), Point(xmax,ymax))
 
-    def segments(self, precision=0):
+    def segments(self, precision=0, tolerance=None):
         '''Return a poly-line approximation ("segments") of the Bezier curve
-           precision is the minimum significant length of a segment'''
-        segments = []
+           precision is the minimum significant length of a segment
+           If tolerance is set the curve is subdivided adaptively instead,
+           tolerance being the maximum distance between curve and poly-line'''
+        xs, ys = self.coordinates(precision, tolerance)
+        return [Point(x, y) for x, y in zip(xs, ys)]
+
+    def coordinates(self, precision=0, tolerance=None):
+        '''Return the poly-line approximation of the Bezier curve as
+           two lists of x and y coordinates, see segments().
+           All points are evaluated together on plain floats, giving
+           the same result as _bezierN without creating a Point per step'''
+        if tolerance is not None:
+            return self._adaptive_coordinates(tolerance)
+
         # n is the number of Bezier points to draw according to precision
         if precision != 0:
             n = int(self.r_length() / precision) + 1
@@ -274,9 +426,122 @@ class Bezier:
         #if n < 10: n = 10
         if n > 1000 : n = 1000
 
-        for t in range(0, n+1):
-            segments.append(self._bezierN(float(t)/n))
-        return segments
+        ts = [float(t)/n for t in range(0, n+1)]
+        xs = [p.x for p in self.pts]
+        ys = [p.y for p in self.pts]
+
+        # Quadratic and cubic curves are unrolled, the first level of
+        # de Casteljau differences doesn't depend on t
+        if self.dimension == 3:
+            x0, x1, x2 = xs
+            y0, y1, y2 = ys
+            dx0, dx1 = x1 - x0, x2 - x1
+            dy0, dy1 = y1 - y0, y2 - y1
+            rx = []
+            ry = []
+            for t in ts:
+                ax = x0 + t * dx0
+                bx = x1 + t * dx1
+                rx.append(ax + t * (bx - ax))
+                ay = y0 + t * dy0
+                by = y1 + t * dy1
+                ry.append(ay + t * (by - ay))
+            return rx, ry
+
+        if self.dimension == 4:
+            x0, x1, x2, x3 = xs
+            y0, y1, y2, y3 = ys
+            dx0, dx1, dx2 = x1 - x0, x2 - x1, x3 - x2
+            dy0, dy1, dy2 = y1 - y0, y2 - y1, y3 - y2
+            rx = []
+            ry = []
+            for t in ts:
+                ax = x0 + t * dx0
+                bx = x1 + t * dx1
+                cx = x2 + t * dx2
+                ax = ax + t * (bx - ax)
+                bx = bx + t * (cx - bx)
+                rx.append(ax + t * (bx - ax))
+                ay = y0 + t * dy0
+                by = y1 + t * dy1
+                cy = y2 + t * dy2
+                ay = ay + t * (by - ay)
+                by = by + t * (cy - by)
+                ry.append(ay + t * (by - ay))
+            return rx, ry
+
+        rx = []
+        ry = []
+        for t in ts:
+            px = list(xs)
+            py = list(ys)
+            for n in range(self.dimension, 1, -1):
+                for i in range(0, n-1):
+                    px[i] = px[i] + t * (px[i+1] - px[i])
+                    py[i] = py[i] + t * (py[i+1] - py[i])
+            rx.append(px[0])
+            ry.append(py[0])
+        return rx, ry
+
+    # Limit on the subdivision depth, 2**16 segments per curve
+    max_depth = 16
+
+    def _adaptive_coordinates(self, tolerance):
+        '''Subdivide the curve in halves until every part is flat,
+           that is within tolerance of its chord'''
+        xs = [p.x for p in self.pts]
+        ys = [p.y for p in self.pts]
+        rx = [xs[0]]
+        ry = [ys[0]]
+
+        stack = [(xs, ys, 0)]
+        while stack:
+            px, py, depth = stack.pop()
+            if depth >= self.max_depth or Bezier._is_flat(px, py, tolerance):
+                rx.append(px[-1])
+                ry.append(py[-1])
+                continue
+
+            # de Casteljau split at t = 0.5
+            lx, ly = [px[0]], [py[0]]
+            hx, hy = [px[-1]], [py[-1]]
+            while len(px) > 1:
+                px = [(a + b) / 2 for a, b in zip(px[:-1], px[1:])]
+                py = [(a + b) / 2 for a, b in zip(py[:-1], py[1:])]
+                lx.append(px[0])
+                ly.append(py[0])
+                hx.append(px[-1])
+                hy.append(py[-1])
+            hx.reverse()
+            hy.reverse()
+
+            # The first half is on top so it is emitted first
+            stack.append((hx, hy, depth + 1))
+            stack.append((lx, ly, depth + 1))
+        return rx, ry
+
+    @staticmethod
+    def _is_flat(px, py, tolerance):
+        '''True if the curve is within tolerance of the segment between
+           the first and the last control point. The curve is never further
+           from it than 1/2 (quadratic) or 3/4 (cubic) of the distance of
+           the furthest control point'''
+        tolerance *= {3: 2.0, 4: 4.0 / 3.0}.get(len(px), 1.0)
+        x0, y0, x1, y1 = px[0], py[0], px[-1], py[-1]
+        dx = x1 - x0
+        dy = y1 - y0
+        l2 = dx * dx + dy * dy
+        tol2 = tolerance * tolerance
+        for x, y in zip(px[1:-1], py[1:-1]):
+            if l2 == 0:
+                t = 0
+            else:
+                t = min(1, max(0, ((x - x0) * dx + (y - y0) * dy) / l2))
+            ex = x - (x0 + t * dx)
+            ey = y - (y0 + t * dy)
+            if ex * ex + ey * ey > tol2:
+                return False
+        return True
 
     @staticmethod
     def _bezier1(p0, p1, t):
@@ -19,7 +19,9 @@ A SVG parser with tools to convert an XML svg file
 to objects that can be simplified into points.
 '''
 
+import concurrent.futures
 import copy
+import functools
 import inspect
 import itertools
 import json
@@ -30,12 +32,16 @@ import os
 import platform
 import re
 import sys
+import tempfile
+import threading
 import xml.etree.ElementTree as etree
+from collections import OrderedDict
 from typing import Iterable, List, Tuple
 
 from fontTools.misc import loggingTools
-from fontTools.pens.svgPathPen import SVGPathPen
+from fontTools.pens.basePen import BasePen
 from fontTools.ttLib import ttFont
+from fontTools.ttLib.sfnt import readTTCHeader
 from svg2mod.coloredlogger import logger
 
 from .geometry import Angle, Bezier, MoveTo, Point, Segment, simplify_segment
@@ -74,12 +80,65 @@ unit_convert = {
 _font_warning_sent = False
 
 
+def _invalidates_geometry(method):
+    '''Wrap a list method so calling it invalidates cached bounding boxes'''
+    @functools.wraps(method)
+    def changed(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        Transformable.geometry_changed()
+        return result
+    return changed
+
+
+class ItemList(list):
+    '''A list of the items of a Transformable.
+    Changing the list invalidates cached bounding boxes, changes to
+    the items themselves are tracked by their transform().
+    '''
+
+    append = _invalidates_geometry(list.append)
+    extend = _invalidates_geometry(list.extend)
+    insert = _invalidates_geometry(list.insert)
+    remove = _invalidates_geometry(list.remove)
+    pop = _invalidates_geometry(list.pop)
+    clear = _invalidates_geometry(list.clear)
+    sort = _invalidates_geometry(list.sort)
+    reverse = _invalidates_geometry(list.reverse)
+    __setitem__ = _invalidates_geometry(list.__setitem__)
+    __delitem__ = _invalidates_geometry(list.__delitem__)
+    __iadd__ = _invalidates_geometry(list.__iadd__)
+    __imul__ = _invalidates_geometry(list.__imul__)
+
+
 class Transformable:
     '''Abstract class for objects that can be geometrically drawn & transformed'''
 
     # This list is all styles that should have the transformation matrix applied
     transformable_styles = ["stroke-width"]
 
+    # Bounding boxes are cached along with the geometry generation they
+    # were computed in. Any transform() or change to a list of items
+    # starts a new generation, which invalidates all cached boxes.
+    _generation = 0
+    _generations = itertools.count(1)
+    # (generation, bounding box) of the last call to bbox()
+    _bbox_cache = None
+
+    @staticmethod
+    def geometry_changed():
+        '''Invalidate all cached bounding boxes'''
+        Transformable._generation = next(Transformable._generations)
+
+    @property
+    def items(self):
+        '''The child items, an ItemList'''
+        return self._items
+
+    @items.setter
+    def items(self, items):
+        self._items = items if isinstance(items, ItemList) else ItemList(items)
+        Transformable.geometry_changed()
+
     def __init__(self, elt=None, parent_styles=None):
         # a 'Transformable' is represented as a list of Transformable items
         self.items = []
@@ -97,12 +156,7 @@ class Transformable:
             self.id = elt.get('id', self.id)
 
             # get inkscape:label as self.name
-            for ident, value in elt.attrib.items():
-
-                ident = self.parse_name( ident )
-                if ident[ "name" ] == "label":
-                    self.name = value
-                    break
+            self.name = self.element_name(elt)
             # self.name isn't set so try setting name to id
             if self.name == '':
                 self.name == self.id
@@ -139,6 +193,14 @@ class Transformable:
         if self.style.get("display") == "none":
             self.hidden = True
 
+    @staticmethod
+    def element_name( elt ):
+        '''Return the label (inkscape:label) of an xml element or an empty string'''
+        for ident, value in elt.attrib.items():
+            if Transformable.parse_name( ident )[ "name" ] == "label":
+                return value
+        return ""
+
     @staticmethod
     def parse_name( tag ):
         '''Read and return name from xml data'''
@@ -149,7 +211,19 @@ class Transformable:
         }
 
     def bbox(self):
-        '''Bounding box of all points'''
+        '''Bounding box of all points
+        The box is cached until the geometry changes, the boxes of all
+        items below are computed and cached on the way.
+        '''
+        generation = Transformable._generation
+        if self._bbox_cache is not None and self._bbox_cache[0] == generation:
+            return self._bbox_cache[1]
+        bbox = self._compute_bbox()
+        self._bbox_cache = (generation, bbox)
+        return bbox
+
+    def _compute_bbox(self):
+        '''Bounding box of all items'''
         b_boxes = [x.bbox() for x in self.items]
         if len( b_boxes ) < 1:
             return (Point(0, 0), Point(0, 0))
@@ -245,6 +319,7 @@ class Transformable:
         else:
             matrix *= self.matrix
         self.transform_styles(matrix)
+        Transformable.geometry_changed()
         for x in self.items:
             x.transform(matrix)
 
@@ -300,39 +375,104 @@ class Svg(Transformable):
     # class Svg handles the <svg> tag
     # tag = 'svg'
 
-    def __init__(self, filename=None):
+    def __init__(self, filename=None, layers=None, ignore_hidden=False):
         self.viewport_scale = 1
         Transformable.__init__(self)
         if filename:
-            self.parse(filename)
+            self.parse(filename, layers, ignore_hidden)
 
-    def parse(self, filename:str):
+    def parse(self, filename:str, layers:Iterable[str]=None, ignore_hidden:bool=False):
         '''Read provided svg xml file and
         append all svg element to items list
+
+        The file is read as a stream, every element is converted as soon
+        as it is complete and its xml is released afterwards, so only the
+        converted items stay in memory.
+
+        layers is a list of layer name patterns as used by the exporters.
+        If given, elements that can't end up on one of these layers are
+        dropped without being converted. If ignore_hidden is set, hidden
+        elements are dropped as well.
         '''
         self.filename = filename
-        tree = etree.parse(filename)
-        self.root = tree.getroot()
-        if self.root.tag != svg_ns + 'svg':
-            raise TypeError('file %s does not seem to be a valid SVG file', filename)
+        self.root = None
+        self._title = None
+
+        if layers is not None:
+            layers = [re.compile( '^{}$'.format( layer ) ) for layer in layers]
+
+        def on_layer( name ):
+            return any( layer.match( name.split( ":", 1 )[0] ) for layer in layers )
+
+        # One entry per open xml element:
+        # (element, group its children are added to or None, on a layer)
+        stack = []
+        for event, elt in etree.iterparse(filename, events=('start', 'end')):
+            if event == 'start':
+                if self.root is None:
+                    self.root = elt
+                    stack.append((elt, self._parse_root(elt), layers is None))
+                    continue
+
+                parent_group, kept = stack[-1][1:]
+                group = None
+                if parent_group is not None and elt.tag == svg_ns + 'g':
+                    group = Group(elt, parent_styles=parent_group.style)
+                    group.viewport = parent_group.viewport
+                    if ignore_hidden and hasattr(group, 'hidden'):
+                        self._skip_hidden(group)
+                        group = None
+                    else:
+                        kept = kept or on_layer(group.name)
+                        parent_group.items.append(group)
+                stack.append((elt, group, kept))
+                continue
+
+            group, kept = stack.pop()[1:]
+            if not stack:
+                break
+            parent_elt, parent_group = stack[-1][:2]
+            # Children of elements other than groups, like the <tspan> of
+            # a <text>, are handled by the element itself
+            if parent_group is None:
+                continue
+
+            if elt.tag == svg_ns + 'g':
+                # Groups that hold nothing on a layer can go again
+                if group is not None and not kept and not group.items:
+                    parent_group.items.remove(group)
+            elif elt.tag == svg_ns + 'title' and parent_elt is self.root:
+                self._title = elt
+            else:
+                self._append_element(parent_group, elt, kept or on_layer(self.element_name(elt)), ignore_hidden)
+
+            # Release the xml of the element, its item holds what's needed
+            parent_elt.remove(elt)
+
+        self.transform()
+
+    def _parse_root(self, root):
+        '''Create the top Group from the <svg> element attributes'''
+        if root.tag != svg_ns + 'svg':
+            raise TypeError('file %s does not seem to be a valid SVG file', self.filename)
 
         # Create a top Group to group all other items (useful for viewBox elt)
         top_group = Group()
         self.items.append(top_group)
 
         # SVG dimension
-        width = self.xlength(self.root.get('width'))
-        height = self.ylength(self.root.get('height'))
+        width = self.xlength(root.get('width'))
+        height = self.ylength(root.get('height'))
 
         # update viewport
         top_group.viewport = Point(width, height)
 
         # viewBox
-        if self.root.get('viewBox') is not None:
-            view_box = re.findall(number_re, self.root.get('viewBox'))
+        if root.get('viewBox') is not None:
+            view_box = re.findall(number_re, root.get('viewBox'))
 
             # If the document somehow doesn't have dimensions get if from viewBox
-            if self.root.get('width') is None or self.root.get('height') is None:
+            if root.get('width') is None or root.get('height') is None:
                 width = float(view_box[2]) - float(view_box[0])
                 height = float(view_box[3]) - float(view_box[1])
                 logger.debug("Unable to find width or height properties. Using viewBox.")
@@ -343,21 +483,38 @@ class Svg(Transformable):
             ty = -float(view_box[1])
             self.viewport_scale = round((float(view_box[2]) - float(view_box[0]))/width, 6)
             top_group.matrix = Matrix([sx, 0, 0, sy, tx, ty])
-        if ( self.root.get("width") is None or self.root.get("height") is None ) \
-                and self.root.get("viewBox") is None:
+        if ( root.get("width") is None or root.get("height") is None ) \
+                and root.get("viewBox") is None:
             logger.critical("Fatal Error: Unable to find SVG dimensions. Exiting.")
             sys.exit(-1)
 
-        # Parse XML elements hierarchically with groups <g>
-        top_group.append(self.root)
+        return top_group
 
-        self.transform()
+    @staticmethod
+    def _append_element(group, elt, kept, ignore_hidden):
+        '''Convert a complete non group xml element and add it to group'''
+        elt_class = svgClass.get(elt.tag, None)
+        if elt_class is None:
+            logger.debug('No handler for element %s' % elt.tag)
+            return
+        if not kept:
+            return
+        item = elt_class(elt, parent_styles=group.style)
+        if ignore_hidden and hasattr(item, 'hidden'):
+            Svg._skip_hidden(item)
+            return
+        item.viewport = group.viewport
+        group.items.append(item)
+
+    @staticmethod
+    def _skip_hidden(item):
+        if item.name:
+            logger.warning(f"Ignoring hidden SVG item: {item.name}")
 
     def title(self):
         '''Returns svg title if exists. Otherwise try to return filename'''
-        t = self.root.find(svg_ns + 'title')
-        if t is not None:
-            return t
+        if self._title is not None:
+            return self._title
         return os.path.splitext(os.path.basename(self.filename))[0]
 
     def json(self):
@@ -484,143 +641,194 @@ class Path(Transformable):
         if elt is not None:
             self.parse(elt.get('d'))
 
+    # Path data is tokenized in one pass over the whole string: it is
+    # split on the command letters, and the numbers of all commands are
+    # converted to floats at once.
+    _command_re = re.compile('([%s])' % COMMANDS)
+    _number_re = re.compile(number_re)
+    # Characters str.split() and float() don't read the way number_re does
+    _not_plain_re = re.compile(r'[^\d\s.eE+\-%s]' % COMMANDS)
+    # Number of values taken by one instance of a command
+    _arity = {'M':2, 'Z':0, 'L':2, 'H':1, 'V':1, 'C':6, 'Q':4, 'S':4, 'T':2}
+
     def parse(self, path_str:str):
         """Parse svg path string and build elements list"""
 
-        path_list = re.findall(number_re + r"|\ *[%s]\ *" % Path.COMMANDS, path_str)
-
-        path_list.reverse()
-
+        path_str = path_str.replace(',', ' ')
+        # [text before the first command, command, its numbers, command, ...]
+        parts = Path._command_re.split(path_str)
+        stray = Path._number_re.search(parts[0])
+        if stray:
+            raise ValueError("No command found at %d" % stray.start())
+        letters = parts[1::2]
+        args = parts[2::2]
+
+        values = None
+        if not Path._not_plain_re.search(path_str):
+            try:
+                values = list(map(float, ' '.join(args).split()))
+                counts = [len(a.split()) for a in args]
+            except ValueError:
+                # Numbers that aren't separated, like '1-2' or '.5.5'
+                pass
+        if values is None:
+            numbers = [Path._number_re.findall(a) for a in args]
+            values = [float(n) for n in itertools.chain.from_iterable(numbers)]
+            counts = [len(n) for n in numbers]
+
+        # Collected first so the items list only changes once
+        items = []
+        append = items.append
         command = None
         current_pt = Point(0,0)
+        cx = cy = 0.0
         start_pt = None
+        end = 0
 
-        while path_list:
-            if path_list[-1].strip() in Path.COMMANDS:
+        try:
+            for i, letter in enumerate(letters):
                 last_command = command
-                command = path_list.pop().strip()
-                absolute = (command == command.upper())
-                command = command.upper()
-            else:
-                if command is None:
-                    raise ValueError("No command found at %d" % len(path_list))
-
-            if command == 'M':
-            # MoveTo
-                x = path_list.pop()
-                y = path_list.pop()
-                pt = Point(x, y)
-                if absolute:
-                    current_pt = pt
-                else:
-                    current_pt += pt
-                start_pt = current_pt
+                command = letter.upper()
+                absolute = command == letter
+                j = end
+                end += counts[i]
+
+                if command == 'Z':
+                    # Close Path
+                    append(Segment(current_pt, start_pt))
+                    current_pt = start_pt
+                    cx, cy = current_pt.x, current_pt.y
+                    continue
 
-                self.items.append(MoveTo(current_pt))
+                if command == 'A':
+                    # Arc flags need the text of the numbers
+                    current_pt = self._parse_arcs(
+                        items, Path._number_re.findall(args[i]), absolute, current_pt)
+                    if current_pt is None:
+                        break
+                    cx, cy = current_pt.x, current_pt.y
+                    continue
 
-                # MoveTo with multiple coordinates means LineTo
-                command = 'L'
+                arity = Path._arity[command]
+                if j == end or (end - j) % arity:
+                    raise ValueError("Expected a multiple of %d numbers for %s, got %d" % (
+                        arity, letter, end - j))
 
-            elif command == 'Z':
-            # Close Path
-                l = Segment(current_pt, start_pt)
-                self.items.append(l)
-                current_pt = start_pt
+                while j < end:
+                    if command == 'L':
+                    # LineTo
+                        if absolute:
+                            cx, cy = values[j], values[j+1]
+                        else:
+                            cx += values[j]
+                            cy += values[j+1]
+                        pt = Point(cx, cy)
+                        append(Segment(current_pt, pt))
+                        current_pt = pt
+
+                    elif command == 'C' or command == 'Q':
+                        if absolute:
+                            bezier_pts = [current_pt] + [
+                                Point(values[k], values[k+1]) for k in range(j, j + arity, 2)]
+                        else:
+                            bezier_pts = [current_pt] + [
+                                Point(values[k] + cx, values[k+1] + cy) for k in range(j, j + arity, 2)]
+                        append(Bezier(bezier_pts))
+                        current_pt = bezier_pts[-1]
+                        cx, cy = current_pt.x, current_pt.y
+
+                    elif command == 'M':
+                    # MoveTo
+                        if absolute:
+                            cx, cy = values[j], values[j+1]
+                        else:
+                            cx += values[j]
+                            cy += values[j+1]
+                        current_pt = start_pt = Point(cx, cy)
+                        append(MoveTo(current_pt))
+                        # MoveTo with multiple coordinates means LineTo
+                        command = 'L'
+
+                    elif command == 'H' or command == 'V':
+                    # Horizontal & Vertical line
+                        if command == 'H':
+                            cx = values[j] if absolute else cx + values[j]
+                        else:
+                            cy = values[j] if absolute else cy + values[j]
+                        pt = Point(cx, cy)
+                        append(Segment(current_pt, pt))
+                        current_pt = pt
 
-            elif command in 'LHV':
-            # LineTo, Horizontal & Vertical line
-                # extra coord for H,V
-                if absolute:
-                    x,y = current_pt.coord()
-                else:
-                    x,y = (0,0)
-
-                if command in 'LH':
-                    x = path_list.pop()
-                if command in 'LV':
-                    y = path_list.pop()
-
-                pt = Point(x, y)
-                if not absolute:
-                    pt += current_pt
-
-                self.items.append(Segment(current_pt, pt))
-                current_pt = pt
-
-            elif command in 'CQ':
-                dimension = {'Q':3, 'C':4}
-                bezier_pts = []
-                bezier_pts.append(current_pt)
-                for _ in range(1,dimension[command]):
-                    x = path_list.pop()
-                    y = path_list.pop()
-                    pt = Point(x, y)
-                    if not absolute:
-                        pt += current_pt
-                    bezier_pts.append(pt)
-
-                self.items.append(Bezier(bezier_pts))
-                current_pt = pt
-
-            elif command in 'TS':
-                # number of points to read
-                num_pts = {'T':1, 'S':2}
-                # the control point, from previous Bezier to mirror
-                ctrl_pt = {'T':1, 'S':2}
-                # last command control
-                last = {'T': 'QT', 'S':'CS'}
-
-                bezier_pts = []
-                bezier_pts.append(current_pt)
-
-                if last_command in last[command]:
-                    pt0 = self.items[-1].control_point(ctrl_pt[command])
-                else:
-                    pt0 = current_pt
-                pt1 = current_pt
-                # Symmetrical of pt1 against pt0
-                bezier_pts.append(pt1 + pt1 - pt0)
-
-                for _ in range(0,num_pts[command]):
-                    x = path_list.pop()
-                    y = path_list.pop()
-                    pt = Point(x, y)
-                    if not absolute:
-                        pt += current_pt
-                    bezier_pts.append(pt)
-
-                self.items.append(Bezier(bezier_pts))
-                current_pt = pt
-
-            elif command == 'A':
-                rx = path_list.pop()
-                ry = path_list.pop()
-                x_rotation = path_list.pop()
+                    else:
+                    # Smooth curves, the first control point is the
+                    # symmetrical of the current point against the last
+                    # control point of the previous Bezier
+                        if last_command in {'T': 'QT', 'S': 'CS'}[command]:
+                            pt0 = items[-1].control_point({'T': 1, 'S': 2}[command])
+                        else:
+                            pt0 = current_pt
+                        bezier_pts = [current_pt, current_pt + current_pt - pt0]
+                        if absolute:
+                            bezier_pts += [
+                                Point(values[k], values[k+1]) for k in range(j, j + arity, 2)]
+                        else:
+                            bezier_pts += [
+                                Point(values[k] + cx, values[k+1] + cy) for k in range(j, j + arity, 2)]
+                        append(Bezier(bezier_pts))
+                        current_pt = bezier_pts[-1]
+                        cx, cy = current_pt.x, current_pt.y
+
+                    j += arity
+        finally:
+            self.items.extend(items)
+
+    def _parse_arcs(self, items, numbers, absolute, current_pt):
+        '''Append the arcs of one A command to items and return the end
+        point, or None if an arc flag isn't 0 or 1.'''
+        letter = 'A' if absolute else 'a'
+        if not numbers:
+            raise ValueError("Expected a multiple of 7 numbers for %s, got 0" % letter)
+        numbers.reverse()
+        while numbers:
+            # Number of values of this arc read so far, once the flags
+            # are reached. Before that it's the numbers that were left.
+            left = len(numbers)
+            got = 0
+            try:
+                rx = numbers.pop()
+                ry = numbers.pop()
+                x_rotation = numbers.pop()
+                got = 3
                 # Arc flags are not necessarily separated numbers
-                flags = path_list.pop().strip()
+                flags = numbers.pop()
+                got += 1
                 large_arc_flag = flags[0]
                 if large_arc_flag not in '01':
                     logger.error("Arc parsing failure")
-                    break
+                    return None
 
-                if len(flags) > 1:  flags = flags[1:].strip()
-                else:               flags = path_list.pop().strip()
+                if len(flags) > 1:  flags = flags[1:]
+                else:               flags = numbers.pop()
+                got += 1
                 sweep_flag = flags[0]
                 if sweep_flag not in '01':
                     logger.error("Arc parsing failure")
-                    break
+                    return None
 
                 if len(flags) > 1:  x = flags[1:]
-                else:               x = path_list.pop()
-                y = path_list.pop()
-                end_pt = Point(x, y)
-                if not absolute: end_pt += current_pt
-                self.items.append(
-                    Arc(current_pt, rx, ry, x_rotation, large_arc_flag, sweep_flag, end_pt))
-                current_pt = end_pt
-
-            else:
-                path_list.pop()
+                else:               x = numbers.pop()
+                got += 1
+                y = numbers.pop()
+            except IndexError:
+                got = got or left
+                raise ValueError("Expected 7 numbers for each arc of %s, got %d" % (
+                    letter, got)) from None
+            end_pt = Point(x, y)
+            if not absolute: end_pt += current_pt
+            items.append(
+                Arc(current_pt, rx, ry, x_rotation, large_arc_flag, sweep_flag, end_pt))
+            current_pt = end_pt
+        return current_pt
 
     def __str__(self):
         return '\n'.join(str(x) for x in self.items)
@@ -628,7 +836,7 @@ class Path(Transformable):
     def __repr__(self):
         return '<Path ' + self.id + '>'
 
-    def segments(self, precision=0) -> List[Segment]:
+    def segments(self, precision=0, tolerance=None) -> List[Segment]:
         '''Return a list of segments, each segment is ended by a MoveTo.
            A segment is a list of Points'''
         ret = []
@@ -638,7 +846,7 @@ class Path(Transformable):
             # Use only non MoveTo item
             if not moveTo:
                 # Generate segments for each relevant item
-                seg = [x.segments(precision) for x in group]
+                seg = [x.segments(precision, tolerance) for x in group]
                 # Merge all segments into one
                 ret.append(list(itertools.chain.from_iterable(seg)))
 
@@ -686,10 +894,10 @@ class Polygon(Path):
     def __repr__(self) -> str:
         return '<Polygon ' + self.id + '>'
 
-    def segments(self, precision=0) -> List[Segment]:
+    def segments(self, precision=0, tolerance=None) -> List[Segment]:
         ''' Return list of segments '''
 
-        seg = [x.segments(precision) for x in self.items]
+        seg = [x.segments(precision, tolerance) for x in self.items]
 
         return [list(itertools.chain.from_iterable(seg))]
 
@@ -728,7 +936,7 @@ class Ellipse(Transformable):
     def __repr__(self):
         return '<Ellipse ' + self.id + '>'
 
-    def bbox(self) -> Tuple[Point, Point]:
+    def _compute_bbox(self) -> Tuple[Point, Point]:
         '''Approximate the bounding box for the given ellipse by
         decomposing the ellipse into a small number of segments.
 
@@ -736,7 +944,7 @@ class Ellipse(Transformable):
         it is much easier to compute the bounding box of segments.
         '''
         if self.arc:
-            return Transformable.bbox(self)
+            return Transformable._compute_bbox(self)
 
         points = self.segments((self.rx+self.ry) / 8)
         if isinstance(points[0], Iterable):
@@ -760,6 +968,7 @@ class Ellipse(Transformable):
         else:
             matrix *= self.matrix
         self.transform_styles(matrix)
+        Transformable.geometry_changed()
 
         self.center = matrix * self.center
         self.rx = matrix.xscale()*self.rx
@@ -775,11 +984,14 @@ class Ellipse(Transformable):
         y = self.center.y + self.ry * math.sin(2 * math.pi * t)
         return Point(x,y)
 
-    def segments(self, precision=0) -> List[Segment]:
-        '''Flatten all curves to segments with target length of precision'''
+    def segments(self, precision=0, tolerance=None) -> List[Segment]:
+        '''Flatten all curves to segments with target length of precision
+        or, if tolerance is set, within tolerance of the curve'''
         if self.arc:
-            segments = self.path.segments(precision)
+            segments = self.path.segments(precision, tolerance)
             return segments
+        if tolerance is not None:
+            precision = self._chord_length(tolerance)
         if max(self.rx, self.ry) < precision:
             return [[self.center]]
 
@@ -796,6 +1008,13 @@ class Ellipse(Transformable):
         ret = [x.rot(math.radians(self.rotation), x=self.center.x, y=self.center.y) for __,x in p]
         return [ret]
 
+    def _chord_length(self, tolerance):
+        '''Longest chord whose sagitta on the largest radius is tolerance'''
+        r = max(self.rx, self.ry)
+        if tolerance >= r:
+            return 2 * r
+        return 2 * math.sqrt(tolerance * (2 * r - tolerance))
+
     def simplify(self, __):
         '''Return self because a 3 point representation is already simple'''
         return self
@@ -960,10 +1179,12 @@ class Arc(Ellipse):
         self.end_pts[0] = self.matrix * self.end_pts[0]
         self.end_pts[1] = self.matrix * self.end_pts[1]
 
-    def segments(self, precision=0) -> List[Segment]:
+    def segments(self, precision=0, tolerance=None) -> List[Segment]:
         '''This returns segments as expected by the
         Path object. (A list of points. Not a list of lists of points)
         '''
+        if tolerance is not None:
+            precision = self._chord_length(tolerance)
         if max(self.rx, self.ry) < precision:
             return self.end_pts
         return Ellipse.segments(self, precision)[0]
@@ -1062,7 +1283,7 @@ class Line(Transformable):
     def __repr__(self):
         return '<Line ' + self.id + '>'
 
-    def bbox(self) -> Tuple[Point, Point]:
+    def _compute_bbox(self) -> Tuple[Point, Point]:
         '''Bounding box'''
         xmin = min([p.x for p in (self.P1, self.P2)])
         xmax = max([p.x for p in (self.P1, self.P2)])
@@ -1081,16 +1302,289 @@ class Line(Transformable):
         else:
             matrix *= self.matrix
         self.transform_styles(matrix)
+        Transformable.geometry_changed()
 
         self.P1 = matrix * self.P1
         self.P2 = matrix * self.P2
         self.segment = Segment(self.P1, self.P2)
 
-    def segments(self, __=0) -> List[Segment]:
+    def segments(self, __=0, tolerance=None) -> List[Segment]:
         '''Return the segment of the line'''
         return [self.segment.segments()]
 
 
+class PathItemPen(BasePen):
+    '''A fontTools pen that builds path items (MoveTo, Segment and Bezier)
+    directly. The resulting items are the same as drawing the glyph
+    into a SVGPathPen and parsing the path string with Path.parse(...)
+    but without formatting and tokenizing the intermediate string.
+    '''
+
+    def __init__(self, glyph_set):
+        BasePen.__init__(self, glyph_set)
+        self.items = []
+        self._start_pt = None
+        self._last_pt = None
+
+    def _moveTo(self, pt):
+        # Like SVGPathPen a moveTo directly after a moveTo replaces it
+        if self.items and isinstance(self.items[-1], MoveTo):
+            self.items.pop()
+        self._start_pt = Point(pt)
+        self._last_pt = pt
+        self.items.append(MoveTo(self._start_pt))
+
+    def _lineTo(self, pt):
+        # Like SVGPathPen duplicate points are dropped
+        if self._last_pt is not None and tuple(pt) == tuple(self._last_pt):
+            return
+        self._last_pt = pt
+        self.items.append(Segment(self._current_point(), Point(pt)))
+
+    def _curveToOne(self, pt1, pt2, pt3):
+        self._last_pt = pt3
+        self.items.append(Bezier([self._current_point(), Point(pt1), Point(pt2), Point(pt3)]))
+
+    def _qCurveToOne(self, pt1, pt2):
+        self._last_pt = pt2
+        self.items.append(Bezier([self._current_point(), Point(pt1), Point(pt2)]))
+
+    def _closePath(self):
+        self.items.append(Segment(self._current_point(), self._start_pt))
+        self._last_pt = None
+
+    def _endPath(self):
+        self._last_pt = None
+
+    def _current_point(self):
+        '''The end point of the last item'''
+        item = self.items[-1]
+        if isinstance(item, MoveTo):
+            return item.dest
+        if isinstance(item, Segment):
+            return item.end
+        return item.pts[-1]
+
+
+def split_font_file(font_file):
+    '''Split a font file reference into the file name and the
+    number of the face in a font collection.
+    Faces of .ttc/.otc collections are referenced as "file#number",
+    all other fonts by their file name, which is face -1.
+    >>> split_font_file('/fonts/Noto.ttc#2')
+    ('/fonts/Noto.ttc', 2)
+    '''
+    path, sep, number = font_file.rpartition('#')
+    if sep and number.isdigit() and not os.path.isfile(font_file):
+        return path, int(number)
+    return font_file, -1
+
+
+class FontIndex:
+    '''Family and style names of the faces in font files, kept in a
+    json file between runs.
+
+    Entries are keyed by file name and hold the size and modification
+    time of the file when it was read, so only new or changed files are
+    opened again. Only the name table of each face is read.
+    '''
+    # Bump when the format of the entries changes
+    version = 1
+
+    def __init__(self, index_file=None):
+        self.index_file = index_file
+        self.files = {}
+        self.changed = False
+        if index_file:
+            try:
+                with open(index_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == FontIndex.version:
+                    self.files = data['files']
+            except (OSError, ValueError, KeyError, AttributeError):
+                pass
+
+    @staticmethod
+    def read_faces(font_file) -> List[Tuple[str, str, str]]:
+        '''Return (font file reference, family, style) of each face in
+        font_file that has the names svg2mod looks fonts up by.
+        '''
+        faces = []
+        with open(font_file, 'rb') as f:
+            if f.read(4) == b'ttcf':
+                f.seek(0)
+                numbers = range(readTTCHeader(f).numFonts)
+            else:
+                numbers = [-1]
+            for number in numbers:
+                try:
+                    f.seek(0)
+                    name = ttFont.TTFont(f, fontNumber=number, lazy=True)["name"]
+                    family = name.getName(1,1,0).toStr()
+                    style = name.getName(2,1,0).toStr()
+                except Exception:
+                    continue
+                ref = font_file if number < 0 else f"{font_file}#{number}"
+                faces.append((ref, family, style))
+        return faces
+
+    def scan(self, font_files, workers=None) -> List[Tuple[str, str, str]]:
+        '''Return (font file reference, family, style) of all faces in
+        font_files, in order. Files that aren't in the index or have
+        changed are read on a pool of `workers` threads.
+        Entries of files not in font_files are dropped.
+        '''
+        stats = {}
+        for font_file in font_files:
+            try:
+                st = os.stat(font_file)
+                stats[font_file] = [st.st_size, st.st_mtime_ns]
+            except OSError:
+                pass
+
+        stale = [
+            font_file for font_file, stat in stats.items()
+            if self.files.get(font_file, {}).get('stat') != stat
+        ]
+
+        def read(font_file):
+            try:
+                return FontIndex.read_faces(font_file)
+            except Exception:
+                # Not a font, still indexed so it isn't read again
+                return []
+
+        if stale:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                for font_file, faces in zip(stale, executor.map(read, stale)):
+                    self.files[font_file] = {'stat': stats[font_file], 'faces': faces}
+            self.changed = True
+
+        for font_file in list(self.files):
+            if font_file not in stats:
+                del self.files[font_file]
+                self.changed = True
+
+        return [tuple(face) for font_file in stats for face in self.files[font_file]['faces']]
+
+    def save(self):
+        '''Write the index, if it changed, to its json file'''
+        if not self.index_file or not self.changed:
+            return
+        # Written to a temporary file first, so readers never see half an index
+        try:
+            directory = os.path.dirname(self.index_file)
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=directory)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'version': FontIndex.version, 'files': self.files}, f)
+            os.replace(tmp_path, self.index_file)
+        except OSError:
+            logger.debug(f"  Unable to write the font index {self.index_file}")
+            return
+        self.changed = False
+
+
+def _default_font_index_file():
+    '''Location of the system font index in the user's cache directory'''
+    system = platform.system()
+    if system == "Windows":
+        cache_dir = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~/AppData/Local")
+    elif system == "Darwin":
+        cache_dir = os.path.expanduser("~/Library/Caches")
+    else:
+        cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_dir, "svg2mod", "fonts.json")
+
+
+class Font:
+    '''A parsed ttf/otf font file.
+    Holds the opened font along with the tables used when converting
+    text to paths so they are only looked up once per file.
+
+    The outline of every glyph that has been drawn is kept as a list
+    of path items in font units. Placing a glyph only copies these
+    items and sets the matrix of the new Path.
+
+    Instances should be obtained through Text.load_font(...) which
+    keeps recently used fonts in memory.
+    '''
+
+    def __init__(self, font_file):
+        self.font_file = font_file
+        path, font_number = split_font_file(font_file)
+        self.mtime = os.path.getmtime(path)
+        self.ttf = ttFont.TTFont(path, fontNumber=font_number)
+        self.glyph_set = self.ttf.getGlyphSet()
+        self.cmap = self.ttf.getBestCmap()
+        self.units_per_em = self.ttf["head"].unitsPerEm
+        self._outlines = {}
+        self._bounds = {}
+
+    def advance_width(self, glyph_name):
+        '''The advance width of glyph_name in font units'''
+        return self.glyph_set[glyph_name].width
+
+    def glyph_bounds(self, glyph_name):
+        '''Bounds (xmin, ymin, xmax, ymax) of the outline of glyph_name
+        in font units, None if the glyph doesn't have an outline.
+        Like the bbox of a converted path these are the bounds of the
+        outline points, including the control points of curves.
+        '''
+        if glyph_name in self._bounds:
+            return self._bounds[glyph_name]
+
+        points = []
+        for item in self._outline(glyph_name):
+            if isinstance(item, MoveTo):
+                points.append(item.dest)
+            elif isinstance(item, Segment):
+                points.extend((item.start, item.end))
+            else:
+                points.extend(item.pts)
+
+        bounds = None
+        if points:
+            bounds = (
+                min(p.x for p in points), min(p.y for p in points),
+                max(p.x for p in points), max(p.y for p in points),
+            )
+        self._bounds[glyph_name] = bounds
+        return bounds
+
+    def _outline(self, glyph_name):
+        outline = self._outlines.get(glyph_name)
+        if outline is None:
+            pen = PathItemPen(self.glyph_set)
+            self.glyph_set[glyph_name].draw(pen)
+            outline = self._outlines[glyph_name] = pen.items
+        return outline
+
+    def glyph_path(self, glyph_name):
+        '''Return a new Path of the outline of glyph_name in font units.
+        If the glyph doesn't have an outline (e.g. space) None is returned.
+        '''
+        outline = self._outline(glyph_name)
+        if not outline:
+            return None
+
+        # Items are replaced by transform() so the points can be shared
+        items = []
+        for item in outline:
+            if isinstance(item, MoveTo):
+                items.append(MoveTo(item.dest))
+            elif isinstance(item, Segment):
+                items.append(Segment(item.start, item.end))
+            else:
+                items.append(Bezier(item.pts))
+        path = Path()
+        path.items = items
+        return path
+
+    def __repr__(self):
+        return '<Font ' + self.font_file + '>'
+
+
 class Text(Transformable):
     '''SVG <text> tag handler
     Take provided xml text element and convert using ttf and otf fonts
@@ -1120,12 +1614,19 @@ class Text(Transformable):
 
     default_font = None
     _system_fonts = {}
+    # Where load_system_fonts keeps its index, None to not keep one
+    font_index_file = _default_font_index_file()
     _os_font_paths = {
         "Darwin": ["/Library/Fonts", "~/Library/Fonts"],
         "Linux": ["/usr/share/fonts","/usr/local/share/fonts","~/.local/share/fonts"],
         "Windows": ["C:/Windows/Fonts", "~/AppData/Local/Microsoft/Windows/Fonts"]
     }
 
+    # Parsed fonts keyed by file name, least recently used first
+    font_cache_size = 8
+    _font_cache = OrderedDict()
+    _font_cache_lock = threading.Lock()
+
     def __init__(self, elt=None, parent=None, *args, **kwargs):
         Transformable.__init__(self, elt, *args, **kwargs)
 
@@ -1328,7 +1829,26 @@ class Text(Transformable):
         is never called elsewhere.
         '''
         self.paths = []
-        if not self.text: return
+        for font, glyphs in self._layout():
+            path = []
+            for glyph_name, translate in glyphs:
+                glyph_path = font.glyph_path(glyph_name)
+                if glyph_path is not None:
+                    path.append(glyph_path)
+                    # This queues the translations until .transform() is called
+                    path[-1].matrix =  translate * path[-1].matrix
+
+            self.paths.append(path)
+        if auto_transform:
+            self.transform()
+
+    def _layout(self):
+        '''Place the glyphs of all strings, returns a (font, glyphs) tuple
+        per string where glyphs holds a (glyph_name, matrix) tuple for
+        each character that is in the font.
+        '''
+        layout = []
+        if not self.text: return layout
         prev_origin = self.text[0][1].origin
 
         offset = Point(prev_origin.x, prev_origin.y)
@@ -1337,45 +1857,70 @@ class Text(Transformable):
             if attrib.font_file is None or attrib.font_family is None:
                 continue
             size = attrib.size
-            ttf = ttFont.TTFont(attrib.font_file)
-            offset.y = attrib.origin.y + ttf["head"].unitsPerEm
-            scale = size/ttf["head"].unitsPerEm
+            font = Text.load_font(attrib.font_file)
+            offset.y = attrib.origin.y + font.units_per_em
+            scale = size/font.units_per_em
 
             if prev_origin != attrib.origin:
                 prev_origin = attrib.origin
                 offset.x = attrib.origin.x
 
-            path = []
+            glyphs = []
             for char in text:
 
-                path_buff = ""
-                try: glf = ttf.getGlyphSet()[ttf.getBestCmap()[ord(char)]]
+                try:
+                    glyph_name = font.cmap[ord(char)]
+                    width = font.advance_width(glyph_name)
                 except KeyError:
                     logger.warning('Unsupported character in <text> element "{}"'.format(char))
                     #txt = txt.replace(char, "")
                     continue
 
-                pen = SVGPathPen(ttf.getGlyphSet())
-                glf.draw(pen)
+                # Apply the scaling then the translation
+                translate = Matrix([1,0,0,-1,offset.x,attrib.origin.y]) * Matrix([scale,0,0,scale,0,0])
+                glyphs.append((glyph_name, translate))
 
-                for cmd in pen._commands:
-                    path_buff += cmd + ' '
+                offset.x += (scale*width)
 
-                if len(path_buff) > 0:
-                    path.append(Path())
-                    path[-1].parse(path_buff)
-                    # Apply the scaling then the translation
-                    translate = Matrix([1,0,0,-1,offset.x,attrib.origin.y]) * Matrix([scale,0,0,scale,0,0])
-                    # This queues the translations until .transform() is called
-                    path[-1].matrix =  translate * path[-1].matrix
+            layout.append((font, glyphs))
+        return layout
+
+    def ink_bbox(self) -> Tuple[Point, Point]:
+        '''The bounding box the paths will have once the text is converted
+        with convert_to_path(), found from the glyph bounds of the fonts
+        without converting the outlines.
+        '''
+        b_boxes = []
+        for font, glyphs in self._layout():
+            for glyph_name, translate in glyphs:
+                bounds = font.glyph_bounds(glyph_name)
+                if bounds is None:
+                    continue
+                # The same matrix that transform() applies to the glyph path.
+                # It flips y, so the top of the glyph ends up at the minimum.
+                matrix = self.matrix * (translate * Matrix())
+                xmin, ymin, xmax, ymax = bounds
+                b_boxes.append((matrix * Point(xmin, ymax), matrix * Point(xmax, ymin)))
 
-                offset.x += (scale*glf.width)
+        if len(b_boxes) == 0:
+            return [Point(0,0),Point(0,0)]
 
-            self.paths.append(path)
-        if auto_transform:
-            self.transform()
+        return (
+            Point(min(b[0].x for b in b_boxes), min(b[0].y for b in b_boxes)),
+            Point(max(b[1].x for b in b_boxes), max(b[1].y for b in b_boxes)),
+        )
+
+    @property
+    def paths(self):
+        '''A list per string of the Paths of its glyphs, an ItemList'''
+        return self._paths
 
-    def bbox(self) -> Tuple[Point, Point]:
+    @paths.setter
+    def paths(self, paths):
+        self._paths = paths if isinstance(paths, ItemList) else ItemList(paths)
+        Transformable.geometry_changed()
+
+    def _compute_bbox(self) -> Tuple[Point, Point]:
         '''Find the bounding box of all the paths that make
         each letter.
         This will only work if there are available paths.
@@ -1400,33 +1945,58 @@ class Text(Transformable):
         else:
             matrix *= self.matrix
         self.transform_styles(matrix)
+        Transformable.geometry_changed()
 
         self.origin = matrix * self.origin
         for paths in self.paths:
             for path in paths:
                 path.transform(matrix)
 
-    def segments(self, precision=0) -> List[Segment]:
+    def segments(self, precision=0, tolerance=None) -> List[Segment]:
         '''Get a list of all points in all paths
-        with provide precision.
+        with provide precision or tolerance.
         This will only work if there are available paths.
         '''
         segments = []
         for paths in self.paths:
             for path in paths:
-                segments.extend(path.segments(precision))
+                segments.extend(path.segments(precision, tolerance))
         return segments
 
     @staticmethod
-    def load_system_fonts(reload:bool=False) -> List[dict]:
+    def load_font(font_file) -> Font:
+        '''Return the parsed Font for font_file.
+        Fonts are only parsed once and kept in a small least recently
+        used cache. A cached font is parsed again if the file has been
+        modified since it was loaded.
+        '''
+        mtime = os.path.getmtime(split_font_file(font_file)[0])
+        with Text._font_cache_lock:
+            font = Text._font_cache.get(font_file)
+            if font is not None and font.mtime == mtime:
+                Text._font_cache.move_to_end(font_file)
+                return font
+
+            font = Font(font_file)
+            Text._font_cache[font_file] = font
+            Text._font_cache.move_to_end(font_file)
+            while len(Text._font_cache) > Text.font_cache_size:
+                Text._font_cache.popitem(last=False)
+        return font
+
+    @staticmethod
+    def load_system_fonts(reload:bool=False, workers:int=None) -> List[dict]:
         '''Find all fonts in common locations on the file system
-        To properly read all fonts they need to be parsed so this
-        is inherently slow on systems with many fonts.
-        To prevent long parsing time all the results are cached
-        and the cached results are returned next time this function
-        is called.
+        The family and style names of the fonts are kept in an index
+        at Text.font_index_file, so only fonts that are new or have
+        changed since the last run are read. Those are read on a pool
+        of `workers` threads.
+        All the results are also cached in memory and the cached
+        results are returned next time this function is called.
         If a force reload of all indexed fonts is desirable setting
         reload to True will clear the cache and re-index the system.
+
+        Faces of font collections are referenced as "file#number".
         '''
         if reload:
             Text._system_fonts = {}
@@ -1439,17 +2009,13 @@ class Text(Transformable):
                 except:
                     pass
 
-            for font_file in fonts_files:
-                try:
-                    font = ttFont.TTFont(font_file)
-                    name = font["name"].getName(1,1,0).toStr()
-                    style = font["name"].getName(2,1,0).toStr()
-                    if Text._system_fonts.get(name) is None:
-                        Text._system_fonts[name] = {style:font_file}
-                    elif Text._system_fonts[name].get(style) is None:
-                        Text._system_fonts[name][style] = font_file
-                except:
-                    pass
+            index = FontIndex(Text.font_index_file)
+            for font_file, name, style in index.scan(fonts_files, workers):
+                if Text._system_fonts.get(name) is None:
+                    Text._system_fonts[name] = {style:font_file}
+                elif Text._system_fonts[name].get(style) is None:
+                    Text._system_fonts[name][style] = font_file
+            index.save()
             logger.debug(f"  Found {len(Text._system_fonts.keys())} fonts in system")
         return Text._system_fonts
 
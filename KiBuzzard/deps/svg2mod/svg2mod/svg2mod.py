@@ -20,6 +20,7 @@ from a svg object into a single continuous line
 '''
 
 import copy
+import math
 from typing import List, Tuple
 
 from svg2mod import svg
@@ -179,6 +180,306 @@ class LineSegment:
 
 #----------------------------------------------------------------------------
 
+class _BucketIndex:
+    '''Index of items by the x range they span. Items are stored in
+    fixed width buckets so only the items near a given x are returned,
+    in the order they were added.
+    '''
+
+    #------------------------------------------------------------------------
+
+    def __init__( self, width: float ):
+        self.width = width if width > 0 else 1.0
+        self.buckets = {}
+        self.items = {}
+
+    #------------------------------------------------------------------------
+
+    def add( self, item, x0: float, x1: float ):
+        '''Add item as spanning x0 to x1. Adding an item again
+        extends its range.
+        '''
+        if x1 < x0:
+            x0, x1 = x1, x0
+        lo = int(math.floor(x0/self.width))
+        hi = int(math.floor(x1/self.width))
+
+        if item in self.items:
+            order, old_lo, old_hi = self.items[item]
+            new = [i for i in range(lo, hi+1) if i < old_lo or i > old_hi]
+            lo, hi = min(lo, old_lo), max(hi, old_hi)
+        else:
+            order = len(self.items)
+            new = range(lo, hi+1)
+
+        self.items[item] = (order, lo, hi)
+        for i in new:
+            self.buckets.setdefault(i, set()).add(item)
+
+    #------------------------------------------------------------------------
+
+    def at( self, x: float, key=None ) -> list:
+        '''Return the items which may span x, sorted by key
+        or else in the order they were added
+        '''
+        bucket = self.buckets.get(int(math.floor(x/self.width)), ())
+        return sorted(bucket, key=key or (lambda item: self.items[item][0]))
+
+    #------------------------------------------------------------------------
+
+#----------------------------------------------------------------------------
+
+class BoundingBoxIndex:
+    '''Grid index of polygons by bounding box. Polygons can only contain
+    one another when their bounding boxes overlap, so the index is used to
+    find the few polygons worth a containment test.
+    '''
+
+    #------------------------------------------------------------------------
+
+    def __init__( self, polygons: List['PolygonSegment'] = (), cell_size: float = None ):
+        if cell_size is None:
+            sizes = sorted(
+                max(p.bbox[1].x - p.bbox[0].x, p.bbox[1].y - p.bbox[0].y) for p in polygons
+            )
+            # Cells around the median polygon size, but not so small that
+            # the largest polygon spans a huge number of them
+            cell_size = max(sizes[len(sizes)//2], sizes[-1]/64) if sizes else 0
+        self.cell_size = cell_size if cell_size > 0 else 1.0
+
+        self.cells = {}
+        self.polygons = {}
+        for polygon in polygons:
+            self.add(polygon)
+
+    #------------------------------------------------------------------------
+
+    def _cells( self, bbox: Tuple[svg.Point, svg.Point] ):
+        x0 = int(math.floor(bbox[0].x/self.cell_size))
+        x1 = int(math.floor(bbox[1].x/self.cell_size))
+        y0 = int(math.floor(bbox[0].y/self.cell_size))
+        y1 = int(math.floor(bbox[1].y/self.cell_size))
+        return [(x, y) for x in range(x0, x1+1) for y in range(y0, y1+1)]
+
+    #------------------------------------------------------------------------
+
+    def add( self, polygon: 'PolygonSegment' ):
+        '''Add a polygon to the index'''
+        cells = self._cells(polygon.bbox)
+        self.polygons[polygon] = (len(self.polygons), cells)
+        for cell in cells:
+            self.cells.setdefault(cell, set()).add(polygon)
+
+    #------------------------------------------------------------------------
+
+    def remove( self, polygon: 'PolygonSegment' ):
+        '''Remove a polygon from the index'''
+        for cell in self.polygons.pop(polygon)[1]:
+            self.cells[cell].discard(polygon)
+
+    #------------------------------------------------------------------------
+
+    def __contains__( self, polygon: 'PolygonSegment' ) -> bool:
+        return polygon in self.polygons
+
+    #------------------------------------------------------------------------
+
+    def overlapping( self, bbox: Tuple[svg.Point, svg.Point] ) -> List['PolygonSegment']:
+        '''Return the polygons whose bounding box overlaps bbox,
+        in the order they were added
+        '''
+        found = set()
+        for cell in self._cells(bbox):
+            found.update(self.cells.get(cell, ()))
+
+        return sorted(
+            (
+                p for p in found if
+                p.bbox[0].x <= bbox[1].x and p.bbox[1].x >= bbox[0].x and
+                p.bbox[0].y <= bbox[1].y and p.bbox[1].y >= bbox[0].y
+            ),
+            key=lambda p: self.polygons[p][0]
+        )
+
+    #------------------------------------------------------------------------
+
+#----------------------------------------------------------------------------
+
+class _PointChain:
+    '''The points of a polygon as a doubly linked list of nodes,
+    used while inlining holes. Points can be inserted anywhere without
+    copying the rest of the polygon. Every node has an order key so
+    positions can still be compared, and nodes can be found by
+    coordinate value, the same way list.index() would find them.
+
+    When a bucket width is given the edges between consecutive nodes
+    are indexed by their x range as well.
+    '''
+
+    class Node:
+        '''A point of the chain with its prev/next links and its order key'''
+        __slots__ = ('point', 'prev', 'next', 'key')
+
+        def __init__( self, point ):
+            self.point = point
+            self.prev = None
+            self.next = None
+            self.key = 0
+
+    spacing = 1 << 32
+
+    #------------------------------------------------------------------------
+
+    @staticmethod
+    def edge_bucket_width( polygon: 'PolygonSegment', extra_points: int = 0 ) -> float:
+        '''A bucket width giving a few edges per bucket, allowing
+        for extra_points to be inserted later
+        '''
+        return 4 * (polygon.bbox[1].x - polygon.bbox[0].x) / (len(polygon.points) + extra_points)
+
+    #------------------------------------------------------------------------
+
+    def __init__( self, points: List[svg.Point], bucket_width: float = None ):
+        self.head = None
+        self.tail = None
+        self.values = {}
+        self.edges = None if bucket_width is None else _BucketIndex(bucket_width)
+        self.modified = False
+
+        self._insert(None, None, points)
+        self.modified = False
+
+    #------------------------------------------------------------------------
+
+    def _insert( self, prev: 'Node', nxt: 'Node', points: List[svg.Point] ) -> None:
+        '''Insert points between the adjacent nodes prev and nxt'''
+
+        lo = prev.key if prev else 0
+        hi = nxt.key if nxt else lo + self.spacing * (len(points) + 1)
+        if hi - lo <= len(points):
+            self._renumber(len(points))
+            lo = prev.key if prev else 0
+            hi = nxt.key if nxt else lo + self.spacing * (len(points) + 1)
+        step = (hi - lo) // (len(points) + 1)
+
+        for point in points:
+            node = self.Node(point)
+            lo += step
+            node.key = lo
+            node.prev = prev
+            if prev:
+                prev.next = node
+            else:
+                self.head = node
+            self.values.setdefault((point.x, point.y), []).append(node)
+            self._index_edge(prev)
+            prev = node
+
+        if prev is not None:
+            prev.next = nxt
+        if nxt:
+            nxt.prev = prev
+        else:
+            self.tail = prev
+        self._index_edge(prev)
+        self.modified = True
+
+    #------------------------------------------------------------------------
+
+    def _renumber( self, room: int ):
+        '''Spread the order keys out to make room for new nodes'''
+        key = 0
+        node = self.head
+        while node:
+            key += self.spacing * (room + 1)
+            node.key = key
+            node = node.next
+
+    #------------------------------------------------------------------------
+
+    def _index_edge( self, node: 'Node' ):
+        if self.edges is not None and node is not None and node.next is not None:
+            self.edges.add(node, node.point.x, node.next.point.x)
+
+    #------------------------------------------------------------------------
+
+    def insert_after( self, node: 'Node', points: List[svg.Point] ):
+        '''Insert points directly after node'''
+        self._insert(node, node.next, points)
+
+    #------------------------------------------------------------------------
+
+    def insert_before( self, node: 'Node', points: List[svg.Point] ):
+        '''Insert points directly before node'''
+        self._insert(node.prev, node, points)
+
+    #------------------------------------------------------------------------
+
+    def first( self, value: Tuple[float, float] ) -> 'Node':
+        '''Return the first node with the given coordinates'''
+        if value not in self.values:
+            raise ValueError("{} is not in the polygon".format(value))
+        return min(self.values[value], key=lambda n: n.key)
+
+    #------------------------------------------------------------------------
+
+    def next_occurrence( self, value: Tuple[float, float], node: 'Node' ) -> 'Node':
+        '''Return the first node with the given coordinates after node'''
+        later = [n for n in self.values.get(value, ()) if n.key > node.key]
+        if not later:
+            raise ValueError("{} is not in the polygon".format(value))
+        return min(later, key=lambda n: n.key)
+
+    #------------------------------------------------------------------------
+
+    def count( self, value: Tuple[float, float] ) -> int:
+        '''Return the number of nodes with the given coordinates'''
+        return len(self.values.get(value, ()))
+
+    #------------------------------------------------------------------------
+
+    def successor( self, node: 'Node' ) -> 'Node':
+        '''The next node, wrapping around to the first'''
+        return node.next or self.head
+
+    #------------------------------------------------------------------------
+
+    def predecessor( self, node: 'Node' ) -> 'Node':
+        '''The previous node, wrapping around to the last'''
+        return node.prev or self.tail
+
+    #------------------------------------------------------------------------
+
+    def crossing_edges( self, line_segment: LineSegment ) -> list:
+        '''Return the start node of every edge that intersects
+        line_segment, which must be vertical, in polygon order.
+        This matches PolygonSegment.intersects(line_segment, False,
+        count_intersections=True, get_points=True).
+        '''
+        crossing = []
+        edge = LineSegment()
+        for node in self.edges.at(line_segment.p.x, key=lambda n: n.key):
+            edge.p = node.point
+            edge.q = node.next.point
+            if line_segment.intersects(edge):
+                crossing.append(node)
+        return crossing
+
+    #------------------------------------------------------------------------
+
+    def to_list( self ) -> List[svg.Point]:
+        '''Return the points in order'''
+        points = []
+        node = self.head
+        while node:
+            points.append(node.point)
+            node = node.next
+        return points
+
+    #------------------------------------------------------------------------
+
+#----------------------------------------------------------------------------
+
 class PolygonSegment:
     ''' A polygon should be a collection of segments
     creating an enclosed or manifold shape.
@@ -212,61 +513,88 @@ class PolygonSegment:
 
     #------------------------------------------------------------------------
 
-    def _find_insertion_point( self, hole: 'PolygonSegment', holes: list, other_insertions: list ):
+    def _find_insertion_point( self, hole: 'PolygonSegment', chains: dict, other_insertions: '_BucketIndex' ):
         ''' KiCad will not "pick up the pen" when moving between a polygon outline
         and holes within it, so we search for a pair of points connecting the
         outline (self) or other previously inserted points to the hole such
         that the connecting segment will not cross the visible inner space
         within any hole.
+
+        chains maps the polygons that have been searched onto their _PointChain,
+        other_insertions indexes the previously inserted holes by their x range.
         '''
 
         highest_point = max(hole.points, key=lambda v: v.y)
-        vertical_line = LineSegment(highest_point, svg.Point(highest_point.x, self.bbox[1].y+1))
-
-        intersections = {self: self.intersects(vertical_line, False, count_intersections=True, get_points=True)}
-        for _,h,__ in other_insertions:
-            if h.bbox[0].x < highest_point.x and h.bbox[1].x > highest_point.x:
-                intersections[h] = h.intersects(vertical_line, False, count_intersections=True, get_points=True)
-
-        best = [self, intersections[self][0]]
-        best.append(LineSegment.vertical_intersection(best[1][0], best[1][1], highest_point.x))
-        for path in intersections:
-            for p,q in intersections[path]:
-                pnt = LineSegment.vertical_intersection(p, q, highest_point.x)
-                if pnt.y < best[2].y:
-                    best = [path, (p,q), pnt]
-
-        if best[2] != best[1][0] and best[2] != best[1][1]:
-            p = best[0].points.index(best[1][0])
-            p_cnt = best[0].points.count(best[1][0])
-
-            q = best[0].points.index(best[1][1])
-            q_cnt = best[0].points.count(best[1][1])
-
-            best_len = len(best[0].points)
+        hx = highest_point.x
+        vertical_line = LineSegment(highest_point, svg.Point(hx, self.bbox[1].y+1))
+
+        # Only edges and holes spanning hx can cross the vertical line
+        edges = chains[self].crossing_edges(vertical_line)
+        best = [self, edges[0]]
+        best.append(LineSegment.vertical_intersection(best[1].point, best[1].next.point, hx))
+        for edge in edges:
+            pnt = LineSegment.vertical_intersection(edge.point, edge.next.point, hx)
+            if pnt.y < best[2].y:
+                best = [self, edge, pnt]
+
+        # The closest crossing wins, ties go to the outline and then to the
+        # earliest inserted hole and edge. Holes are visited nearest first:
+        # bridge points stay within the bbox of the hole they split, so once
+        # a hole starts beyond the best point none of the rest can improve on it.
+        best_rank = (-1, 0)
+        others = [
+            (h.bbox[0].y, rank, h) for rank, h in enumerate(other_insertions.at(hx))
+            if h.bbox[0].x < hx and h.bbox[1].x > hx
+        ]
+        others.sort(key=lambda o: o[:2])
+        for min_y, rank, h in others:
+            if min_y > best[2].y:
+                break
+            if h not in chains:
+                chains[h] = _PointChain(h.points, _PointChain.edge_bucket_width(h))
+            for edge in chains[h].crossing_edges(vertical_line):
+                pnt = LineSegment.vertical_intersection(edge.point, edge.next.point, hx)
+                if pnt.y < best[2].y or (pnt.y == best[2].y and (rank, edge.key) < best_rank):
+                    best = [h, edge, pnt]
+                    best_rank = (rank, edge.key)
+
+        edge_p, edge_q = best[1].point, best[1].next.point
+        if best[2] != edge_p and best[2] != edge_q:
+            chain = chains[best[0]]
+            p_value = (edge_p.x, edge_p.y)
+            q_value = (edge_q.x, edge_q.y)
+
+            # Points are located by value, as the first occurrence in the
+            # polygon, then moved on to later occurrences until they are
+            # neighbours. Positions are compared using the node order keys.
+            p = chain.first(p_value)
+            p_cnt = chain.count(p_value)
+
+            q = chain.first(q_value)
+            q_cnt = chain.count(q_value)
 
             tried = [[p],[q]]
             # The same point can be present multiple times without being part of the
             # desired segment. The points are also not next to each other.
             while (
                (p_cnt > 1 or q_cnt > 1) and
-               (p + 1)%best_len != q and
-               (p - 1)%best_len != q
+               chain.successor(p) is not q and
+               chain.predecessor(p) is not q
             ):
                 if len(tried[0]) < p_cnt:
-                    p = best[0].points.index(best[1][0], p+1)
+                    p = chain.next_occurrence(p_value, p)
                     tried[0].append(p)
                 elif len(tried[1]) < q_cnt:
                     p = tried[0][0]
                     tried[0] = [p]
-                    q = best[0].points.index(best[1][1], q+1)
+                    q = chain.next_occurrence(q_value, q)
                     tried[1].append(q)
                 else:
                     logger.error("Unable to find segment for inlining.")
                     break
 
-            ip = p if p < q else q
-            best[0]._set_points(best[0].points[:ip+1] + [best[2]] + best[0].points[ip+1:])
+            ip = p if p.key < q.key else q
+            chain.insert_after(ip, [best[2]])
 
         return (best[2], hole, highest_point)
 
@@ -305,36 +633,51 @@ class PolygonSegment:
 
         segments.sort(reverse=True, key=lambda h: h.bbox[1].y)
 
-        all_segments = segments[ : ] + [ self ]
+        # Bridge points are spliced into linked chains rather than lists,
+        # so adding one does not copy the whole outline
+        chains = {self: _PointChain(self.points, _PointChain.edge_bucket_width(self, len(segments)))}
         insertions = []
+        inserted = _BucketIndex(
+            (self.bbox[1].x - self.bbox[0].x) / len(segments)
+        )
 
         # Find the insertion point for each hole:
         for hole in segments:
 
-            insertion = self._find_insertion_point( hole, all_segments, insertions)
+            insertion = self._find_insertion_point( hole, chains, inserted)
 
             if insertion is not None:
                 insertions.append( insertion )
+                inserted.add(hole, hole.bbox[0].x, hole.bbox[1].x)
+
+        for polygon, chain in chains.items():
+            if chain.modified:
+                polygon._set_points(chain.to_list())
 
         # Prevent returned points from affecting original object
-        points = copy.deepcopy(self.points)
+        copies = {}
+        points = _PointChain([
+            copies.setdefault(id(p), svg.Point(p.x, p.y)) for p in self.points
+        ])
 
         for insertion in insertions:
 
-            ip = points.index(insertion[0])
-            hole = insertion[1].points_starting_on_index(insertion[1].points.index(insertion[2]))
+            ip = points.first((insertion[0].x, insertion[0].y))
+            hole = insertion[1].points_starting_on_index(
+                [(p.x, p.y) for p in insertion[1].points].index((insertion[2].x, insertion[2].y))
+            )
 
             if (
-                points[ ip ].x == hole[ 0 ].x and
-                points[ ip ].y == hole[ 0 ].y
+                ip.point.x == hole[ 0 ].x and
+                ip.point.y == hole[ 0 ].y
             ):
                 # The point at the insertion point is duplicated so any action on that will affect both
-                points = points[:ip] + [copy.copy(points[ip])] + hole[ 1 : -1 ] + points[ip:]
+                points.insert_before(ip, [copy.copy(ip.point)] + hole[ 1 : -1 ])
             else:
                 # The point at the insertion point is duplicated so any action on that will affect both
-                points = points[:ip] + [copy.copy(points[ip])] + hole + points[ip:]
+                points.insert_before(ip, [copy.copy(ip.point)] + hole)
 
-        return points
+        return points.to_list()
 
 
     #------------------------------------------------------------------------
@@ -2,7 +2,8 @@
 from logging import exception
 import os
 import re
-import copy
+import threading
+import traceback
 
 import wx
 import base64
@@ -10,57 +11,81 @@ import json
 
 from . import dialog_text_base
 
-def ParseFloat(InputString, DefaultValue=0.001):
-    value = DefaultValue
-    if InputString != "":
-        try:
-            value = float(InputString)
-        except ValueError:
-            print("Value not valid")
-    return value
-
-def ParseInt(InputString, DefaultValue=0):
-    value = DefaultValue
-    if InputString != "":
-        try:
-            value = int(InputString)
-        except ValueError:
-            print("Value not valid")
-    return value
+class PreviewWorker(threading.Thread):
+    """Renders label previews away from the UI thread.
+
+    Only the newest request is kept: a request that has not started yet is
+    replaced by the next one, and the dialog drops results that belong to
+    an older generation. self.result holds the settings, polygons and error
+    of the render the buzzard is currently set up with.
+    """
+
+    def __init__(self, buzzard, callback):
+        threading.Thread.__init__(self, daemon=True)
+        self.buzzard = buzzard
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.result = None
+
+        self._condition = threading.Condition()
+        self._request = None
+        self._stopped = False
+
+    def request(self, generation, settings, size=None):
+        with self._condition:
+            self._request = (generation, settings, size)
+            self._condition.notify()
+
+    def cancel(self):
+        with self._condition:
+            self._request = None
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._request = None
+            self._condition.notify()
+
+    def render(self, settings, size=None):
+        with self.lock:
+            polys, error = [], None
+            if self.buzzard.configure(settings):
+                try:
+                    polys = self.buzzard.generate(settings['MultiLineText'], size)
+                except Exception:
+                    traceback.print_exc()
+                    error = "Error generating label"
+            self.result = (settings, polys, error)
+            return polys, error
+
+    def run(self):
+        while True:
+            with self._condition:
+                while self._request is None and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                generation, settings, size = self._request
+                self._request = None
+
+            polys, error = self.render(settings, size)
+            wx.CallAfter(self.callback, generation, polys, error)
+
 
 class Dialog(dialog_text_base.DIALOG_TEXT_BASE):
 
-    config_defaults = {
-        'MultiLineText': 'KiBuzzard',
-        'HeightCtrl': '2',
-        'FontComboBox': 'UbuntuMono-B',
-        'LayerComboBox': 'F.Cu',
-        'CapLeftChoice': '[',
-        'CapRightChoice': ']',
-        'PaddingTopCtrl': '3.75',
-        'PaddingLeftCtrl': '3.75',
-        'PaddingRightCtrl': '3.75',
-        'PaddingBottomCtrl': '3.75',
-        'LineSpacingCtrl': '1.5',
-        'WidthCtrl': None,
-        'AlignmentChoice': 'Center',
-        'advancedCheckbox': False,
-        'inlineFormatTextbox': False,
-        'lineoverStyleChoice': 'rounded',
-        'lineoverThicknessCtrl': '1'
-    }
+    # Settings that don't change the shape of the label, the preview is not
+    # rendered again when only these change
+    preview_free_params = {'LayerComboBox', 'advancedCheckbox'}
+
+    # Milliseconds without further changes before a preview is rendered
+    render_delay = 50
 
     def __init__(self, parent, config, buzzard, func):
         dialog_text_base.DIALOG_TEXT_BASE.__init__(self, parent)
         
-        typeface_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'buzzard', 'typeface')
-        for entry in os.listdir(typeface_path):
-            entry_path = os.path.join(typeface_path, entry)
-            
-            if not (entry_path.endswith('.ttf') or entry_path.endswith('.otf')):
-                continue
-            
-            self.m_FontComboBox.Append(os.path.splitext(entry)[0])
+        for name in buzzard.typefaces():
+            self.m_FontComboBox.Append(name)
         
         self.m_FontComboBox.SetSelection(0)
 
@@ -86,6 +111,8 @@ class Dialog(dialog_text_base.DIALOG_TEXT_BASE):
         self.label_params = {}
         self.updateFootprint = None
 
+        # The engine owns the label settings and their defaults
+        self.config_defaults = dict(buzzard.param_defaults)
         self.loadConfig()
 
         if self.m_advancedCheckbox.IsChecked():
@@ -100,23 +127,51 @@ class Dialog(dialog_text_base.DIALOG_TEXT_BASE):
         self.buzzard = buzzard
 
         self.polys = []
+        # Bounds of the polygons and their device space coordinates for the
+        # current panel size, so repainting doesn't redo the scaling
+        self.preview_bounds = None
+        self.preview_cache = None
+        # Panel size the preview was rendered for, curves are only flattened
+        # as finely as it can show
+        self.preview_size = None
+
+        # Previews are rendered on a worker thread, each request gets a new
+        # generation so results of outdated requests can be dropped
+        self.preview_generation = 0
+        self.preview_worker = PreviewWorker(buzzard, self.OnPreviewDone)
+        self.preview_worker.start()
         
         self.m_PreviewPanel.Bind(wx.EVT_PAINT, self.OnPaint)
+        self.m_PreviewPanel.Bind(wx.EVT_SIZE, self.OnPreviewSize)
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.OnDestroy)
 
-        self.Bind(wx.EVT_TIMER, self.labelEditOnText)
         self.m_sdbSizerCancel.Bind(wx.EVT_BUTTON, self.Cancel)
 
-        self.timer = wx.Timer(self, 0)
-        self.timer.Start(milliseconds=250, oneShot=True)
+        # Changed settings are marked dirty and a render is scheduled once
+        # the input settles. Everything starts dirty for the first preview.
+        for key in self.config_defaults:
+            obj = getattr(self, "m_{}".format(key))
+            for event in self.SettingEvents(obj):
+                obj.Bind(event, lambda e, key=key: self.OnSettingChange(e, key))
+
+        self.dirty = set(self.config_defaults)
+        self.render_call = wx.CallLater(self.render_delay, self.OnSettingsSettled)
 
         self.m_MultiLineText.SelectAll()
 
     def Cancel(self, e):
-        self.timer.Stop()
+        self.render_call.Stop()
+        self.preview_worker.stop()
 
         self.saveConfig()
         e.Skip()
 
+    def OnDestroy(self, e):
+        if e.GetEventObject() is self:
+            self.render_call.Stop()
+            self.preview_worker.stop()
+        e.Skip()
+
 
     def loadConfig(self):
         # check if we have a footprint we can load value from first
@@ -143,7 +198,7 @@ class Dialog(dialog_text_base.DIALOG_TEXT_BASE):
             return
 
         # else load up last sessions config
-        params = self.config_defaults
+        params = dict(self.config_defaults)
         try:
             with open(self.config_file, 'r') as cf:
                 json_params = json.load(cf)
@@ -189,22 +244,65 @@ class Dialog(dialog_text_base.DIALOG_TEXT_BASE):
         params = {}
 
         for item in self.config_defaults.keys():
-            obj = getattr(self, "m_{}".format(item))
-            if hasattr(obj, "GetValue"):
-                params.update({item: obj.GetValue()})
-            elif hasattr(obj, "GetStringSelection"):
-                params.update({item: obj.GetStringSelection()})
-            else:
-                raise Exception("Invalid item")    
+            params.update({item: self.SettingValue(item)})
         return params
 
+    def SettingValue(self, item):
+        obj = getattr(self, "m_{}".format(item))
+        if hasattr(obj, "GetValue"):
+            return obj.GetValue()
+        elif hasattr(obj, "GetStringSelection"):
+            return obj.GetStringSelection()
+        else:
+            raise Exception("Invalid item")
+
+    @staticmethod
+    def SettingEvents(obj):
+        # Events fired when the user changes the value of a settings control
+        if isinstance(obj, wx.stc.StyledTextCtrl):
+            return [wx.stc.EVT_STC_CHANGE]
+        if isinstance(obj, wx.SpinCtrlDouble):
+            return [wx.EVT_SPINCTRLDOUBLE, wx.EVT_TEXT]
+        if isinstance(obj, wx.SpinCtrl):
+            return [wx.EVT_SPINCTRL, wx.EVT_TEXT]
+        if isinstance(obj, wx.ComboBox):
+            return [wx.EVT_COMBOBOX, wx.EVT_TEXT]
+        if isinstance(obj, wx.Choice):
+            return [wx.EVT_CHOICE]
+        if isinstance(obj, wx.CheckBox):
+            return [wx.EVT_CHECKBOX]
+        return []
+
+    def OnSettingChange(self, event, key):
+        self.SettingChanged(key)
+        event.Skip()
+
+    def SettingChanged(self, key):
+        self.dirty.add(key)
+        # Restarting the delay coalesces bursts of changes, like typing,
+        # into a single render
+        self.render_call.Start(self.render_delay)
 
-    def labelEditOnText( self, event ):
-        while self.label_params != self.CurrentSettings():
-            self.label_params.update(self.CurrentSettings())
+    def OnSettingsSettled(self):
+        dirty, self.dirty = self.dirty - self.preview_free_params, set()
+        if any(self.SettingValue(key) != self.label_params.get(key) for key in dirty) or self.PreviewTooCoarse():
             self.ReGeneratePreview()
-        self.timer.Start(milliseconds=250, oneShot=True)
+
+    def OnPreviewSize(self, event):
+        if self.PreviewTooCoarse():
+            self.render_call.Start(self.render_delay)
         event.Skip()
+
+    def PreviewSize(self):
+        size = self.m_PreviewPanel.GetSize()
+        return (size.GetWidth(), size.GetHeight())
+
+    def PreviewTooCoarse(self):
+        # A preview rendered for a smaller panel has to be rendered again when enlarged
+        if self.preview_size is None:
+            return False
+        size = self.PreviewSize()
+        return size[0] > self.preview_size[0] or size[1] > self.preview_size[1]
     
     def OnCharHook( self, event ):
         if (event.GetKeyCode() == wx.WXK_RETURN) and (event.ShiftDown() or event.ControlDown()):
@@ -217,72 +315,89 @@ class Dialog(dialog_text_base.DIALOG_TEXT_BASE):
         self.label_params = {}
 
     def ReGeneratePreview(self, e=None):
-        self.polys = []
-        self.error = None
-
-        self.buzzard.fontName = self.m_FontComboBox.GetValue()
-        self.buzzard.lineSpacing = ParseFloat(self.m_LineSpacingCtrl.GetValue()) * 10
-
-        requestedHeight = ParseFloat(self.m_HeightCtrl.GetValue())
-        requestedWidth = ParseFloat(self.m_WidthCtrl.GetValue())
-
-        # When editing the text height field. If the value is null, avoid a divide by 0 exception
-        if requestedHeight == 0:
+        settings = self.CurrentSettings()
+        self.label_params = dict(settings)
+
+        # Any render still running is now outdated
+        self.preview_generation += 1
+        self.preview_worker.cancel()
+
+        if not self.SkipRender(settings):
+            self.preview_size = self.PreviewSize()
+            self.preview_worker.request(self.preview_generation, settings, self.preview_size)
+
+    def SkipRender(self, settings):
+        # Show labels that are not rendered, returns True if it was one
+        if len(settings['MultiLineText']) == 0:
+            self.ShowPreview([], None)
+            return True
+        if len(settings['MultiLineText']) > 128:
+            self.ShowPreview([], "Text input too long")
+            return True
+        return False
+
+    def OnPreviewDone(self, generation, polys, error):
+        # Posted from the worker thread, the dialog may be gone already
+        if not self or generation != self.preview_generation:
             return
-        
-        self.buzzard.padding.top = ParseFloat(self.m_PaddingTopCtrl.GetValue())
-        self.buzzard.padding.left = ParseFloat(self.m_PaddingLeftCtrl.GetValue())
-        self.buzzard.padding.right = ParseFloat(self.m_PaddingRightCtrl.GetValue())
-        self.buzzard.padding.bottom = ParseFloat(self.m_PaddingBottomCtrl.GetValue())
-        
-        #this was originally in buzzard.py but have moved it here in order to accomodate
-        #realtime updates of padding
-        for attr in ['left', 'right', 'top', 'bottom']:
-            if getattr(self.buzzard.padding,attr) <= 0: setattr(self.buzzard.padding, attr, 0.001) 
- 
-        self.buzzard.layer = self.m_LayerComboBox.GetValue()
-
-        self.buzzard.alignment = self.m_AlignmentChoice.GetStringSelection()
-        # KiBuzzard aims to size uppercase letters at the height requested.
-        # Font size include space below the baseline and above the "caps height" for larger glyphs like `[]`
-        # All fonts are slightly different. So we render a 'H' to determine the scale of the selected font.
-        text_height = self.buzzard.text_height()
-
-        # Scale font and apply DPI
-        self.buzzard.scaleFactor = (requestedHeight/text_height) * (96/25.4)
-        self.buzzard.width = ParseFloat(self.m_WidthCtrl.GetValue(), 0.0) * (96/25.4) * 1/self.buzzard.scaleFactor
-
-        styles = {'':'', '(':'round', '[':'square', '<':'pointer', '/':'fslash', '\\':'bslash', '>':'flagtail'}
-        self.buzzard.leftCap = styles[self.m_CapLeftChoice.GetStringSelection()]
-
-        styles = {'':'', ')':'round', ']':'square', '>':'pointer', '/':'fslash', '\\':'bslash', '<':'flagtail'}
-        self.buzzard.rightCap = styles[self.m_CapRightChoice.GetStringSelection()]
-
-        if self.m_inlineFormatTextbox.IsChecked():
-            self.buzzard.inlineFormat = True
-        else:
-            self.buzzard.inlineFormat = False
-
-        self.buzzard.lineOverThickness = ParseInt(self.m_lineoverThicknessCtrl.GetValue(), DefaultValue=1) 
+        self.ShowPreview(polys, error)
 
-        self.buzzard.lineOverStyle = self.m_lineoverStyleChoice.GetString(self.m_lineoverStyleChoice.GetSelection())
+    def ShowPreview(self, polys, error):
+        self.polys = polys
+        self.error = error
+        self.preview_bounds = self.PolyBounds(polys)
+        self.preview_cache = None
+        self.RePaint()
 
-        
-        if len(self.m_MultiLineText.GetValue()) == 0:
-            self.RePaint()
-            return
-        if len(self.m_MultiLineText.GetValue()) > 128:
-            self.error = "Text input too long"
+    @staticmethod
+    def PolyBounds(polys):
+        # Bounds around the origin and all polygons, None if there is nothing to draw
+        bboxes = [poly.bbox() for poly in polys if len(poly)]
+        if not bboxes:
+            return None
+        min_x = min([0] + [b[0].x for b in bboxes])
+        max_x = max([0] + [b[1].x for b in bboxes])
+        min_y = min([0] + [b[0].y for b in bboxes])
+        max_y = max([0] + [b[1].y for b in bboxes])
+        if max_x == min_x or max_y == min_y:
+            return None
+        return min_x, min_y, max_x, max_y
+
+    def DevicePolys(self, size):
+        if self.preview_cache is None or self.preview_cache[0] != size:
+            min_x, min_y, max_x, max_y = self.preview_bounds
+            size_x, size_y = size
+
+            scale = (size_x * 0.95) / (max_x - min_x)
+            scale = min(scale, (size_y * 0.95) / (max_y - min_y))
+
+            self.preview_cache = (size, [poly.coords(scale) for poly in self.polys])
+        return self.preview_cache[1]
+
+    def FinishPreview(self):
+        # The footprint is created from the state of the buzzard, so once the
+        # worker is done it must hold a render of the current settings
+        self.preview_worker.stop()
+        self.preview_worker.join()
+        self.preview_generation += 1
+
+        settings = self.CurrentSettings()
+        self.label_params = dict(settings)
+        if self.SkipRender(settings):
             return
-        
-        try:
-            self.polys = self.buzzard.generate(self.m_MultiLineText.GetValue())
-        except Exception:
-            import traceback
-            traceback.print_exc()
-            self.error = "Error generating label"
 
-        self.RePaint()        
+        result = self.preview_worker.result
+        if result is not None and self.SameShape(result[0], settings):
+            if result[0] != settings:
+                self.buzzard.configure(settings)
+            self.ShowPreview(*result[1:])
+        else:
+            self.preview_size = self.PreviewSize()
+            self.ShowPreview(*self.preview_worker.render(settings, self.preview_size))
+
+    def SameShape(self, a, b):
+        return all(a.get(key) == b.get(key) for key in set(a) | set(b)
+            if key not in self.preview_free_params)
 
     def RePaint(self, e=None):
         self.Layout()
@@ -309,46 +424,14 @@ class Dialog(dialog_text_base.DIALOG_TEXT_BASE):
             dc.SetDeviceOrigin(int(size_x/2), int(size_y/2))
             dc.SetBrush(wx.Brush('#000000'))
 
-            if len(self.polys):
-                # Create copy of poly list for scaling preview
-                polys = copy.deepcopy(self.polys)
-
-
-                # TODO use matrix for scaling
-                # TODO use bbox to determine scaling
-                min_x = 0
-                max_x = 0
-                for i in range(len(self.polys)):
-                    for j in range(len(self.polys[i])):
-                        min_x = min(self.polys[i][j].x, min_x)
-                        max_x = max(self.polys[i][j].x, max_x)
-
-                min_y = 0
-                max_y = 0
-                for i in range(len(self.polys)):
-                    for j in range(len(self.polys[i])):
-                        min_y = min(self.polys[i][j].y, min_y)
-                        max_y = max(self.polys[i][j].y, max_y)
-
-                width = max_x - min_x
-                height = max_y - min_y
-                if width == 0 or height == 0:
-                    return
-
-                scale = (size_x * 0.95) / width
-                scale = min(scale, (size_y * 0.95) / height)
-
-                #scale = min(15.0, scale)
-                for i in range(len(polys)):
-                    for j in range(len(polys[i])):
-                        polys[i][j] = (scale*polys[i][j].x,scale*polys[i][j].y)
-
-                dc.DrawPolygonList(polys)
+            if self.preview_bounds is not None:
+                dc.DrawPolygonList(self.DevicePolys((size_x, size_y)))
 
 
     def OnOkClick(self, event):
-        self.timer.Stop()
+        self.render_call.Stop()
         self.saveConfig()
+        self.FinishPreview()
         
         self.func(self, self.buzzard)
 
@@ -361,20 +444,21 @@ class Dialog(dialog_text_base.DIALOG_TEXT_BASE):
             self.m_lineoverPanel.Hide()
             self.m_spCharPanel.Hide()
             self.m_AdvancedDivider.Hide()
+            # SetValue doesn't send a checkbox event
             self.m_inlineFormatTextbox.SetValue(False)
-            self.buzzard.inlineFormat = False
-            self.ReGeneratePreview()
+            self.SettingChanged('inlineFormatTextbox')
 
         self.RePaint()
 
+    # Renders for these are scheduled by OnSettingChange
     def inlineFormatChange(self, event):
-        self.ReGeneratePreview()
+        event.Skip()
 
     def thicknessCtrlChange(self, event):
-        self.ReGeneratePreview()
+        event.Skip()
 
     def lineoverStyleChange(self, event):
-        self.ReGeneratePreview()
+        event.Skip()
 
     def addCharOhm(self, event):
         self.m_MultiLineText.SetValue(self.m_MultiLineText.GetValue()+"Ω")
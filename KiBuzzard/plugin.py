@@ -8,11 +8,8 @@ import wx.aui
 from wx import FileConfig
 
 import pcbnew
-import base64
-import json
-from .dialog import Dialog
 
-from .buzzard.buzzard import Buzzard
+from .util import add_paths, paths
 
 
 class KiBuzzardPlugin(pcbnew.ActionPlugin, object):
@@ -43,6 +40,14 @@ class KiBuzzardPlugin(pcbnew.ActionPlugin, object):
         return False
 
     def Run(self):
+        # The dialog and render engine are imported on first use, so they
+        # don't add to the pcbnew startup time
+        with add_paths(paths):
+            from .dialog import Dialog
+            from .buzzard.buzzard import Buzzard, EncodeParams
+            from .buzzard.cache import RenderCache
+            from .bulk import parse_footprint, replace_footprint
+
         if self._pcbnew_frame is None:
             try:
                 tlws = wx.GetTopLevelWindows()
@@ -64,9 +69,7 @@ class KiBuzzardPlugin(pcbnew.ActionPlugin, object):
                 return
 
             if self.IsVersion(['5.99','6.', '7.', '8.', '9.', '10.']):
-                json_str = json.dumps(dlg.label_params, sort_keys=True)
-                encoded_str = base64.b64encode(json_str.encode('utf-8')).decode('ascii')
-                footprint_string = p_buzzard.create_v6_footprint(parm_text=encoded_str)
+                footprint_string = p_buzzard.create_v6_footprint(parm_text=EncodeParams(dlg.label_params))
 
                 if dlg.updateFootprint is None:
                     # New footprint
@@ -82,30 +85,8 @@ class KiBuzzardPlugin(pcbnew.ActionPlugin, object):
                     # Create new footprint, and replace old ones place
                     self.logger.log(logging.DEBUG, "Updating selected footprint {}".format(dlg.updateFootprint))
                     try:
-                        b = pcbnew.GetBoard()
-                        
-                        pos = dlg.updateFootprint.GetPosition()
-                        orient = dlg.updateFootprint.GetOrientationDegrees()
-                        wasOnBackLayer = dlg.updateFootprint.GetLayer() == pcbnew.B_Cu
-
-                        self.logger.log(logging.DEBUG, " pos: {}".format(pos))
-                        self.logger.log(logging.DEBUG, " orient: {}".format(orient))
-                        self.logger.log(logging.DEBUG, " need_flip: {}".format(wasOnBackLayer))
-                        
-                        try:
-                            io = pcbnew.PCB_PLUGIN()
-                        except AttributeError:
-                            io = pcbnew.PCB_IO_KICAD_SEXPR()
-                        
-                        new_fp = pcbnew.Cast_to_FOOTPRINT(io.Parse(footprint_string))
-                        b.Add(new_fp)
-                        new_fp.SetPosition(pos)
-                        # Flip before setting orientation
-                        if wasOnBackLayer:
-                            new_fp.Flip(pos, True)
-                        new_fp.SetOrientationDegrees(orient)
-
-                        b.Remove(dlg.updateFootprint)
+                        new_fp = parse_footprint(footprint_string, pcbnew)
+                        replace_footprint(pcbnew.GetBoard(), dlg.updateFootprint, new_fp, pcbnew)
                     except Exception:
                         import traceback
                         wx.LogError(traceback.format_exc())
@@ -113,7 +94,12 @@ class KiBuzzardPlugin(pcbnew.ActionPlugin, object):
                 self.logger.log(logging.ERROR, "Version check failed \"{}\" not in version list".format(self.kicad_build_version))
             dlg.EndModal(wx.ID_OK)
 
-        dlg = Dialog(self._pcbnew_frame, self.config_file, Buzzard(), run_buzzard)
+        # Finished labels are kept next to the config, so repeated labels
+        # don't have to be rendered again in later sessions
+        buzzard = Buzzard()
+        buzzard.diskCache = RenderCache(os.path.join(os.path.dirname(self.config_file), 'cache'))
+
+        dlg = Dialog(self._pcbnew_frame, self.config_file, buzzard, run_buzzard)
     
         try:
             if dlg.ShowModal() == wx.ID_OK:
@@ -1,5 +1,13 @@
+import os
 import sys
 
+dir_path = os.path.dirname(os.path.realpath(__file__))
+paths = [
+    os.path.join(dir_path, 'deps'), 
+    os.path.join(dir_path, 'deps', 'fonttools', 'Lib'), 
+    os.path.join(dir_path, 'deps', 'svg2mod')
+]
+
 class add_paths():
     def __init__(self, paths):
         self.paths = paths
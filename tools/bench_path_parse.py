@@ -0,0 +1,105 @@
+'''
+Measure svg.Path.parse on real path data: the outlines of every glyph
+in the bundled typefaces, as fontTools' SVGPathPen writes them, and the
+paths of the svg2mod example logo.
+
+    python tools/bench_path_parse.py -n 5
+
+With --dump FILE the parsed items of every path are written out as
+text, so the output of two versions of the parser can be diffed.
+'''
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import xml.etree.ElementTree as etree
+
+repo_path = os.path.realpath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, repo_path)
+
+from KiBuzzard.util import add_paths, paths
+
+typeface_path = os.path.join(repo_path, 'KiBuzzard', 'buzzard', 'typeface')
+logo_file = os.path.join(repo_path, 'KiBuzzard', 'deps', 'svg2mod', 'examples', 'svg2mod.svg')
+
+
+def glyph_paths():
+    from fontTools.pens.svgPathPen import SVGPathPen
+    from fontTools.ttLib import ttFont
+
+    data = []
+    for name in sorted(os.listdir(typeface_path)):
+        if not name.lower().endswith(('.ttf', '.otf')):
+            continue
+        font = ttFont.TTFont(os.path.join(typeface_path, name))
+        glyph_set = font.getGlyphSet()
+        for glyph_name in font.getGlyphOrder():
+            pen = SVGPathPen(glyph_set)
+            glyph_set[glyph_name].draw(pen)
+            d = pen.getCommands()
+            if d:
+                data.append(d)
+    return data
+
+
+def logo_paths():
+    return [
+        elt.get('d')
+        for elt in etree.parse(logo_file).iter('{http://www.w3.org/2000/svg}path')
+        if elt.get('d')
+    ]
+
+
+def describe(item):
+    # Full precision coordinates, str() of the geometry rounds to 3 digits
+    pts = getattr(item, 'pts', None) or [
+        getattr(item, name) for name in ('dest', 'start', 'end') if hasattr(item, name)]
+    if not pts:
+        return str(item)
+    return type(item).__name__ + ' ' + ' '.join(repr((p.x, p.y)) for p in pts)
+
+
+def measure(Path, data, runs):
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        for d in data:
+            Path().parse(d)
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-n', '--runs', type=int, default=5,
+        help='Number of passes over each data set (default: 5)')
+    parser.add_argument('--dump', metavar='FILE',
+        help='Write the parsed items of every path to FILE')
+    args = parser.parse_args()
+
+    with add_paths(paths):
+        from svg2mod.svg.svg import Path
+
+        data_sets = {'glyphs': glyph_paths(), 'logo': logo_paths()}
+
+        if args.dump:
+            with open(args.dump, 'w') as f:
+                for data in data_sets.values():
+                    for d in data:
+                        path = Path()
+                        path.parse(d)
+                        f.write('\n'.join(describe(item) for item in path.items) + '\n\n')
+
+        print('{:<10}{:>8}{:>10}{:>10}{:>10}'.format('', 'paths', 'median', 'min', 'max'))
+        for name, data in data_sets.items():
+            times = measure(Path, data, args.runs)
+            print('{:<10}{:>8}{:>8.1f}ms{:>8.1f}ms{:>8.1f}ms'.format(
+                name, len(data),
+                statistics.median(times) * 1000, min(times) * 1000, max(times) * 1000,
+            ))
+
+
+if __name__ == '__main__':
+    main()
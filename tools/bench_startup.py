@@ -0,0 +1,90 @@
+'''
+Measure KiBuzzard startup cost: how long the plugin package takes to
+import (this happens on every pcbnew launch), how long the render engine
+takes to import, and the latency of the first label preview.
+
+Each measurement runs in a fresh interpreter so nothing is cached in
+sys.modules. Run it from KiCad's python to include the pcbnew/wx plugin
+registration, or from any python for the headless numbers:
+
+    python tools/bench_startup.py -n 10
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+repo_path = os.path.realpath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Each snippet prints a json dict of timings in seconds
+snippets = {
+    'plugin import': '''
+import sys, time, json
+try:
+    import pcbnew
+except ImportError:
+    pass
+t0 = time.perf_counter()
+import KiBuzzard
+t1 = time.perf_counter()
+print(json.dumps({'time': t1 - t0, 'wx': 'wx' in sys.modules}))
+''',
+    'engine import': '''
+import sys, time, json
+t0 = time.perf_counter()
+from KiBuzzard.util import add_paths, paths
+with add_paths(paths):
+    from KiBuzzard.buzzard.buzzard import Buzzard
+t1 = time.perf_counter()
+print(json.dumps({'time': t1 - t0, 'wx': 'wx' in sys.modules}))
+''',
+    'first preview': '''
+import sys, time, json
+t0 = time.perf_counter()
+from KiBuzzard.util import add_paths, paths
+with add_paths(paths):
+    from KiBuzzard.buzzard.buzzard import Buzzard
+b = Buzzard()
+b.configure(Buzzard.param_defaults)
+b.generate(Buzzard.param_defaults['MultiLineText'])
+t1 = time.perf_counter()
+print(json.dumps({'time': t1 - t0, 'wx': 'wx' in sys.modules}))
+''',
+}
+
+
+def measure(snippet, runs):
+    times = []
+    wx_loaded = False
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, '-c', snippet],
+            cwd=repo_path, check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        times.append(result['time'])
+        wx_loaded = wx_loaded or result['wx']
+    return times, wx_loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-n', '--runs', type=int, default=5,
+        help='Number of fresh interpreters per measurement (default: 5)')
+    args = parser.parse_args()
+
+    print('{:<16}{:>10}{:>10}{:>10}  {}'.format('', 'median', 'min', 'max', 'wx imported'))
+    for name, snippet in snippets.items():
+        times, wx_loaded = measure(snippet, args.runs)
+        print('{:<16}{:>8.1f}ms{:>8.1f}ms{:>8.1f}ms  {}'.format(
+            name,
+            statistics.median(times) * 1000, min(times) * 1000, max(times) * 1000,
+            'yes' if wx_loaded else 'no',
+        ))
+
+
+if __name__ == '__main__':
+    main()